@@ -3,11 +3,16 @@ FastAPI application for EasyTempInbox API
 """
 import os
 import sys
+import json
 import time
-import boto3
-from fastapi import FastAPI, HTTPException, Query, Request
+import asyncio
+import gzip
+import hashlib
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
+from starlette.datastructures import Headers
 from mangum import Mangum
 from dotenv import load_dotenv
 from rate_limiter import rate_limit_middleware
@@ -20,15 +25,33 @@ if os.getenv('LOCAL_TESTING') == 'true':
     # Add parent directory to path for local imports
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
     from models.inbox import (
-        Inbox, InboxCreateRequest, InboxCreateResponse, InboxStatusResponse
+        Inbox, InboxCreateRequest, InboxCreateResponse, InboxStatusResponse,
+        InboxBatchCreateRequest, InboxBatchCreateResponse
     )
-    from models.email import EmailListResponse, EmailListItem, EmailDetailResponse, Email, AttachmentResponse
+    from models.email import (
+        EmailListResponse, EmailDetailResponse,
+        EmailBatchRequest, EmailBatchResponse,
+        email_id_bound, email_id_timestamp, is_time_ordered_id, unpack_bodies, email_list_response
+    )
+    from storage.aio import AsyncClient, run_blocking
+    from storage.factory import get_storage_backend
+    from storage.cache import get_inbox_cache
+    from storage.notify import get_notification_hub
 else:
     # Production: models are packaged in the Lambda deployment
     from models.inbox import (
-        Inbox, InboxCreateRequest, InboxCreateResponse, InboxStatusResponse
+        Inbox, InboxCreateRequest, InboxCreateResponse, InboxStatusResponse,
+        InboxBatchCreateRequest, InboxBatchCreateResponse
+    )
+    from models.email import (
+        EmailListResponse, EmailDetailResponse,
+        EmailBatchRequest, EmailBatchResponse,
+        email_id_bound, email_id_timestamp, is_time_ordered_id, unpack_bodies, email_list_response
     )
-    from models.email import EmailListResponse, EmailListItem, EmailDetailResponse, Email, AttachmentResponse
+    from storage.aio import AsyncClient, run_blocking
+    from storage.factory import get_storage_backend
+    from storage.cache import get_inbox_cache
+    from storage.notify import get_notification_hub
 
 # Initialize FastAPI app
 app = FastAPI(title="EasyTempInbox API", version="1.0.0")
@@ -40,6 +63,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Retry-After"],
+)
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip (gzip;q=0 refuses it)"""
+    gzip_q = wildcard_q = None
+    for entry in accept_encoding.split(','):
+        coding, _, params = entry.partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == 'gzip':
+            gzip_q = q
+        elif coding == '*':
+            wildcard_q = q
+    q = gzip_q if gzip_q is not None else wildcard_q
+    return q is not None and q > 0
+
+
+class AcceptEncodingGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that also honours q-values (it only looks for "gzip")"""
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and not accepts_gzip(Headers(scope=scope).get('accept-encoding', '')):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Response compression for clients that accept gzip. Responses that already
+# set Content-Encoding (pre-compressed email details) pass through as-is.
+app.add_middleware(
+    AcceptEncodingGZipMiddleware,
+    minimum_size=int(os.getenv('GZIP_MINIMUM_SIZE', '1000')),
+    compresslevel=int(os.getenv('GZIP_COMPRESSION_LEVEL', '6')),
 )
 
 # Canonical URL redirect middleware
@@ -94,38 +158,78 @@ async def redirect_to_canonical(request: Request, call_next):
 
     return await call_next(request)
 
-# AWS clients
-#dynamodb = boto3.client('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-INBOXES_TABLE = os.getenv('DYNAMODB_INBOXES_TABLE', 'easytempinbox-inboxes')
-EMAILS_TABLE = os.getenv('DYNAMODB_EMAILS_TABLE', 'easytempinbox-emails')
-
 # Configuration
 DEFAULT_TTL = int(os.getenv('DEFAULT_TTL_SECONDS', '3600'))
 MIN_TTL = int(os.getenv('MIN_TTL_SECONDS', '600'))
 MAX_TTL = int(os.getenv('MAX_TTL_SECONDS', '86400'))
 PRIMARY_DOMAIN = os.getenv('PRIMARY_DOMAIN', 'easytempinbox.com')
-S3_BUCKET = os.getenv('S3_BUCKET_NAME', 'easytempinbox-raw-emails')
-if os.getenv('LOCAL_TESTING') == 'true':
-    dynamodb = boto3.client(
-        'dynamodb',
-        region_name='us-east-1',
-        endpoint_url='http://localhost:8000',
-        aws_access_key_id='test',
-        aws_secret_access_key='test'
-    )
-    s3 = boto3.client(
-        's3',
-        region_name='us-east-1',
-        aws_access_key_id='test',
-        aws_secret_access_key='test'
-    )
-else:
-    dynamodb = boto3.client('dynamodb', region_name=os.getenv('AWS_REGION', 'us-east-1'))
-    s3 = boto3.client('s3', region_name=os.getenv('AWS_REGION', 'us-east-1'))
+# Conditional writes tried per inbox creation before giving up on ID collisions
+INBOX_CREATE_ATTEMPTS = int(os.getenv('INBOX_CREATE_ATTEMPTS', '3'))
+# Most inboxes one batch creation request may ask for
+INBOX_BATCH_MAX_SIZE = int(os.getenv('INBOX_BATCH_MAX_SIZE', '500'))
+# Most emails one batch fetch may ask for (same as the largest list page)
+EMAIL_BATCH_MAX_SIZE = int(os.getenv('EMAIL_BATCH_MAX_SIZE', '100'))
+# Hold /wait requests open until mail arrives. Off by default: under Lambda
+# every waiting client would pin an instance for the whole wait, so enable
+# it only when the API runs as a long-lived server.
+LONG_POLL_ENABLED = os.getenv('LONG_POLL_ENABLED', 'false').lower() == 'true'
+# The parser assigns email IDs before it writes the rows, so an email can
+# become visible after a newer one; `since` queries look back this far (the
+# parser Lambda's maximum timeout) to catch it
+SINCE_LOOKBACK_SECONDS = int(os.getenv('LIST_SINCE_LOOKBACK_SECONDS', '900'))
+# API Gateway times out integrations at 29s, so waits must finish well before
+MAX_WAIT_SECONDS = int(os.getenv('LONG_POLL_MAX_WAIT_SECONDS', '25'))
+
+# Storage backend (DynamoDB + S3 by default, see storage/factory.py).
+# Blocking calls run on a bounded thread pool (see storage/aio.py) so a
+# slow DynamoDB/S3 round trip never stalls the event loop.
+storage = AsyncClient(get_storage_backend())
+
+# Inbox records are immutable, so polling routes share a TTL/LRU cache of them
+inbox_cache = get_inbox_cache()
+
+# Wakes long-poll requests when a watched inbox receives mail
+notification_hub = get_notification_hub(storage)
+
+
+async def get_cached_inbox(inbox_id: str):
+    """Get an inbox through the inbox cache, loading it on a miss"""
+    found, inbox = inbox_cache.lookup(inbox_id)
+    if not found:
+        inbox = await storage.get_inbox(inbox_id)
+        inbox_cache.store(inbox_id, inbox)
+    return inbox
+
+
+async def get_fresh_inbox(inbox_id: str):
+    """
+    Get an inbox with up-to-date counters
+
+    Unknown/expired IDs are answered from the cache; live inboxes are
+    re-read since email_count changes on every delivery.
+    """
+    found, inbox = inbox_cache.lookup(inbox_id)
+    if not found or inbox is not None:
+        inbox = await storage.get_inbox(inbox_id)
+        inbox_cache.store(inbox_id, inbox)
+    return inbox
+
+
+def list_etag(inbox: Inbox, *params) -> str:
+    """
+    ETag for an email list page; changes whenever the inbox receives mail
+
+    The parser bumps email_count/last_received_at only after the email's
+    row is written, so a page served under this tag already includes it.
+    """
+    state = f"{inbox.id}:{inbox.email_count}:{inbox.last_received_at}:{params}"
+    return f'W/"{hashlib.sha1(state.encode()).hexdigest()[:20]}"'
+
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Health check endpoint"""
+    await rate_limit_middleware(request, 'general')
     return {"status": "ok", "service": "EasyTempInbox API"}
 
 
@@ -138,7 +242,7 @@ async def create_inbox(request: Request, inbox_request: InboxCreateRequest = Inb
     - ttl: Time to live in seconds (default: 3600, min: 600, max: 86400)
 
     Rate Limits:
-    - 5 inbox creations per hour per IP
+    - 10 inbox creations per hour per IP
     """
     # Check rate limit
     await rate_limit_middleware(request, 'create_inbox')
@@ -151,17 +255,21 @@ async def create_inbox(request: Request, inbox_request: InboxCreateRequest = Inb
             detail=f"TTL must be between {MIN_TTL} and {MAX_TTL} seconds"
         )
     
-    # Create inbox
-    inbox = Inbox.create(ttl_seconds=ttl)
-    
-    # Store in DynamoDB
+    # Create and store the inbox; the write fails rather than overwrite an
+    # existing inbox, so retry with a fresh ID on the rare collision
     try:
-        dynamodb.put_item(
-            TableName=INBOXES_TABLE,
-            Item=inbox.to_dynamodb_item()
-        )
+        for _ in range(INBOX_CREATE_ATTEMPTS):
+            inbox = Inbox.create(ttl_seconds=ttl)
+            if await storage.put_inbox(inbox):
+                break
+            print(f"Inbox ID collision on {inbox.id}, retrying")
+        else:
+            raise HTTPException(status_code=503, detail="Could not allocate an inbox ID, please retry")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create inbox: {str(e)}")
+    inbox_cache.store(inbox.id, inbox)
     
     return InboxCreateResponse(
         id=inbox.id,
@@ -170,12 +278,76 @@ async def create_inbox(request: Request, inbox_request: InboxCreateRequest = Inb
     )
 
 
+@app.post("/api/inbox/batch", response_model=InboxBatchCreateResponse)
+async def create_inboxes(request: Request, batch_request: InboxBatchCreateRequest):
+    """
+    Create many temporary inboxes in one request (for test automation)
+
+    Body:
+    - count: Number of inboxes (1 to 500)
+    - ttl: Time to live in seconds for all of them (default: 3600, min: 600, max: 86400)
+
+    Rate Limits:
+    - 1000 inboxes per hour per IP, separate from single inbox creation
+    """
+    count = batch_request.count
+    if count < 1 or count > INBOX_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"count must be between 1 and {INBOX_BATCH_MAX_SIZE}"
+        )
+    ttl = batch_request.ttl or DEFAULT_TTL
+    if ttl < MIN_TTL or ttl > MAX_TTL:
+        raise HTTPException(
+            status_code=400,
+            detail=f"TTL must be between {MIN_TTL} and {MAX_TTL} seconds"
+        )
+    
+    await rate_limit_middleware(request, 'create_inbox_batch', cost=count)
+    
+    # Batched writes cannot be conditional, so taken IDs are found with a
+    # batched read first and replaced, along with any IDs left unwritten
+    created = {}
+    pending = Inbox.create_many(count, ttl)
+    try:
+        for _ in range(INBOX_CREATE_ATTEMPTS):
+            taken = await storage.get_inboxes([inbox.id for inbox in pending])
+            fresh = {}
+            for inbox in pending:
+                if inbox.id not in taken and inbox.id not in created:
+                    fresh[inbox.id] = inbox
+            unwritten = set(await storage.put_inboxes(list(fresh.values())))
+            for inbox_id, inbox in fresh.items():
+                if inbox_id not in unwritten:
+                    created[inbox_id] = inbox
+            if len(created) == count:
+                break
+            pending = Inbox.create_many(count - len(created), ttl)
+        else:
+            raise HTTPException(status_code=503, detail="Could not create all inboxes, please retry")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create inboxes: {str(e)}")
+    
+    inboxes = []
+    for inbox in created.values():
+        inbox_cache.store(inbox.id, inbox)
+        inboxes.append(InboxCreateResponse(
+            id=inbox.id,
+            address=inbox.get_email_address(PRIMARY_DOMAIN),
+            expires_at=inbox.expires_at
+        ))
+    return InboxBatchCreateResponse(inboxes=inboxes, count=len(inboxes))
+
+
 @app.get("/api/inbox/{inbox_id}/emails", response_model=EmailListResponse)
 async def list_emails(
     request: Request,
     inbox_id: str,
     limit: int = Query(default=20, le=100),
-    last_key: str = Query(default=None)
+    last_key: str = Query(default=None),
+    since: str = Query(default=None)
 ):
     """
     List all emails for an inbox
@@ -186,22 +358,27 @@ async def list_emails(
     Query Parameters:
     - limit: Maximum number of emails to return (default: 20, max: 100)
     - last_key: Pagination key from previous response
+    - since: Only return emails newer than this received_at timestamp or
+      email_id. Emails received up to SINCE_LOOKBACK_SECONDS before it are
+      included too, as they may have been written after it; clients merge
+      the result by email_id.
+
+    The response carries an ETag; sending it back in If-None-Match returns
+    304 Not Modified while the inbox has not received mail.
 
     Rate Limits:
-    - 100 requests per minute per IP
+    - 100 requests per minute per IP and inbox (shared with email and
+      attachment retrieval)
+    - 300 retrieval requests per minute per IP across all inboxes
     """
     # Check rate limit
-    await rate_limit_middleware(request, 'general')
+    await rate_limit_middleware(request, 'retrieval', inbox_id)
     # Check if inbox exists
     try:
-        response = dynamodb.get_item(
-            TableName=INBOXES_TABLE,
-            Key={'id': {'S': inbox_id}}
-        )
-        if 'Item' not in response:
+        inbox = await get_fresh_inbox(inbox_id)
+        if inbox is None:
             raise HTTPException(status_code=404, detail="Inbox not found or expired")
         
-        inbox = Inbox.from_dynamodb_item(response['Item'])
         if inbox.is_expired():
             raise HTTPException(status_code=404, detail="Inbox has expired")
     except HTTPException:
@@ -209,110 +386,102 @@ async def list_emails(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to check inbox: {str(e)}")
     
+    # Unchanged inbox: skip the query entirely
+    etag = list_etag(inbox, limit, last_key, since)
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers={'ETag': etag})
+    
     # Query emails
     try:
-        query_params = {
-            'TableName': EMAILS_TABLE,
-            'KeyConditionExpression': 'inbox_id = :inbox_id',
-            'ExpressionAttributeValues': {':inbox_id': {'S': inbox_id}},
-            'Limit': limit,
-            'ScanIndexForward': False  # Sort by received_at descending
-        }
-        
-        if last_key:
-            query_params['ExclusiveStartKey'] = {'inbox_id': {'S': inbox_id}, 'email_id': {'S': last_key}}
+        after_key = None
+        min_received_at = None
+        lookback_ms = SINCE_LOOKBACK_SECONDS * 1000
+        if since and since.isdigit():
+            # Newer than the given second: key range above that second's IDs
+            after_key = email_id_bound(max(0, (int(since) + 1) * 1000 - 1 - lookback_ms), upper=True)
+        elif since and is_time_ordered_id(since):
+            after_key = email_id_bound(max(0, email_id_timestamp(since) - lookback_ms))
+        elif since:
+            # Legacy UUID4 cursor: fall back to filtering on received_at
+            cursor = await storage.get_email_summary(inbox_id, since)
+            if cursor is None:
+                raise HTTPException(status_code=400, detail="Unknown since cursor")
+            min_received_at = cursor.received_at
         
-        response = dynamodb.query(**query_params)
-        
-        emails = []
-        for item in response.get('Items', []):
-            email = Email.from_dynamodb_item(item)
-            emails.append(EmailListItem(
-                email_id=email.email_id,
-                from_address=email.from_address,
-                subject=email.subject,
-                received_at=email.received_at,
-                has_html=bool(email.html_body)
-            ))
-        
-        next_key = None
-        if 'LastEvaluatedKey' in response:
-            next_key = response['LastEvaluatedKey']['email_id']['S']
+        emails, next_key = await storage.query_email_summaries(
+            inbox_id, limit, last_key, after_key, min_received_at
+        )
+        if min_received_at is not None:
+            emails = [email for email in emails if email.email_id != since]
         
-        return EmailListResponse(
-            emails=emails,
-            count=len(emails),
-            last_key=next_key
+        # Rendered directly rather than through EmailListResponse; the
+        # payload has the same shape. Browsers revalidate with
+        # If-None-Match on every request.
+        return JSONResponse(
+            email_list_response(emails, next_key),
+            headers={'ETag': etag, 'Cache-Control': 'no-cache'}
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to list emails: {str(e)}")
 
 
 @app.get("/api/email/{inbox_id}/{email_id}", response_model=EmailDetailResponse)
-async def get_email(inbox_id: str, email_id: str):
+async def get_email(request: Request, inbox_id: str, email_id: str):
     """
     Get a specific email
     
     Path Parameters:
     - inbox_id: The inbox ID
     - email_id: The email ID
+
+    Rate Limits:
+    - 100 requests per minute per IP and inbox
+    - 300 retrieval requests per minute per IP across all inboxes
     """
+    await rate_limit_middleware(request, 'retrieval', inbox_id)
     try:
-        response = dynamodb.get_item(
-            TableName=EMAILS_TABLE,
-            Key={
-                'inbox_id': {'S': inbox_id},
-                'email_id': {'S': email_id}
-            }
-        )
-        
-        if 'Item' not in response:
+        email = await storage.get_email(inbox_id, email_id)
+        if email is None:
             raise HTTPException(status_code=404, detail="Email not found")
         
-        email = Email.from_dynamodb_item(response['Item'])
+        # Stored pre-serialized and gzipped at ingest: sent as-is, or only
+        # decompressed for clients that do not accept gzip
+        if email.detail is not None:
+            if accepts_gzip(request.headers.get('accept-encoding', '')):
+                return Response(
+                    email.detail,
+                    media_type='application/json',
+                    headers={'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+                )
+            return Response(
+                await run_blocking(gzip.decompress, email.detail),
+                media_type='application/json',
+                headers={'Vary': 'Accept-Encoding'}
+            )
         
-        # Convert attachments to response format
-        attachments = [
-            AttachmentResponse(
-                id=att.id,
-                filename=att.filename,
-                content_type=att.content_type,
-                size=att.size
-            ) for att in email.attachments
-        ]
+        # Large bodies are stored in S3 rather than in the item
+        text_body, html_body = email.text_body, email.html_body
+        if email.large_body_url:
+            data = await storage.get_blob(email.large_body_url)
+            text_body, html_body = await run_blocking(unpack_bodies, data)
         
-        return EmailDetailResponse(
-            email_id=email.email_id,
-            from_address=email.from_address,
-            subject=email.subject,
-            text_body=email.text_body,
-            html_body=email.html_body,
-            received_at=email.received_at,
-            large_body_url=email.large_body_url,
-            attachments=attachments
-        )
+        # Rendered directly rather than through EmailDetailResponse
+        return JSONResponse(email.to_response(text_body, html_body))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get email: {str(e)}")
 
 
-@app.get("/api/inbox/{inbox_id}/status", response_model=InboxStatusResponse)
-async def get_inbox_status(inbox_id: str):
-    """
-    Get inbox status (lightweight endpoint for polling)
-    
-    Path Parameters:
-    - inbox_id: The inbox ID
-    """
+async def inbox_status(inbox_id: str) -> InboxStatusResponse:
+    """Current status of an inbox, as returned by the status and wait routes"""
     try:
-        # Get inbox
-        inbox_response = dynamodb.get_item(
-            TableName=INBOXES_TABLE,
-            Key={'id': {'S': inbox_id}}
-        )
+        inbox = await get_fresh_inbox(inbox_id)
         
-        if 'Item' not in inbox_response:
+        if inbox is None:
             return InboxStatusResponse(
                 id=inbox_id,
                 exists=False,
@@ -320,8 +489,6 @@ async def get_inbox_status(inbox_id: str):
                 email_count=0
             )
         
-        inbox = Inbox.from_dynamodb_item(inbox_response['Item'])
-        
         if inbox.is_expired():
             return InboxStatusResponse(
                 id=inbox_id,
@@ -330,26 +497,163 @@ async def get_inbox_status(inbox_id: str):
                 email_count=0
             )
         
-        # Count emails
-        count_response = dynamodb.query(
-            TableName=EMAILS_TABLE,
-            KeyConditionExpression='inbox_id = :inbox_id',
-            ExpressionAttributeValues={':inbox_id': {'S': inbox_id}},
-            Select='COUNT'
-        )
-        
         return InboxStatusResponse(
             id=inbox_id,
             exists=True,
             expires_at=inbox.expires_at,
-            email_count=count_response.get('Count', 0)
+            email_count=inbox.email_count
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get inbox status: {str(e)}")
 
 
+@app.post("/api/inbox/{inbox_id}/emails/batch", response_model=EmailBatchResponse)
+async def get_emails_batch(request: Request, inbox_id: str, batch_request: EmailBatchRequest):
+    """
+    Get many emails of an inbox in one request
+
+    Path Parameters:
+    - inbox_id: The inbox ID
+
+    Body:
+    - email_ids: IDs of the emails to fetch (at most 100)
+
+    Emails are returned in the requested order, with the same fields as
+    GET /api/email; IDs that do not exist, or whose offloaded bodies could
+    not be read, are listed in `missing`. The response is streamed as each
+    email is encoded.
+
+    Rate Limits:
+    - 100 requests per minute per IP and inbox (shared with email retrieval)
+    - 300 retrieval requests per minute per IP across all inboxes
+    """
+    await rate_limit_middleware(request, 'retrieval', inbox_id)
+    
+    email_ids = list(dict.fromkeys(batch_request.email_ids))
+    if not email_ids or len(email_ids) > EMAIL_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"email_ids must hold between 1 and {EMAIL_BATCH_MAX_SIZE} IDs"
+        )
+    
+    try:
+        inbox = await get_cached_inbox(inbox_id)
+        if inbox is None or inbox.is_expired():
+            raise HTTPException(status_code=404, detail="Inbox not found or expired")
+        
+        # One BatchGetItem (retrying unprocessed keys) for all the items
+        emails = await storage.get_emails(inbox_id, email_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get emails: {str(e)}")
+    
+    # Read offloaded bodies concurrently before the 200 is sent, so a failed
+    # S3 read lands the email in `missing` instead of truncating the stream
+    async def load_bodies(email):
+        data = await storage.get_blob(email.large_body_url)
+        return await run_blocking(unpack_bodies, data)
+    
+    offloaded = [emails[email_id] for email_id in email_ids
+                 if email_id in emails and emails[email_id].large_body_url]
+    results = await asyncio.gather(*(load_bodies(email) for email in offloaded), return_exceptions=True)
+    bodies = {}
+    for email, result in zip(offloaded, results):
+        if isinstance(result, Exception):
+            print(f"Error reading bodies of email {email.email_id}: {result}")
+        else:
+            bodies[email.email_id] = result
+    
+    found = [
+        emails[email_id] for email_id in email_ids
+        if email_id in emails and (not emails[email_id].large_body_url or email_id in bodies)
+    ]
+    found_ids = {email.email_id for email in found}
+    missing = [email_id for email_id in email_ids if email_id not in found_ids]
+    
+    async def stream():
+        yield b'{"emails":['
+        for index, email in enumerate(found):
+            if email.detail is not None:
+                # Already serialized at ingest
+                yield (b',' if index else b'') + await run_blocking(gzip.decompress, email.detail)
+                continue
+            text_body, html_body = bodies.get(email.email_id, (None, None))
+            payload = email.to_response(text_body, html_body)
+            yield (b',' if index else b'') + json.dumps(
+                payload, ensure_ascii=False, separators=(',', ':')
+            ).encode('utf-8')
+        tail = {'count': len(found), 'missing': missing}
+        yield b'],' + json.dumps(tail, separators=(',', ':')).encode('utf-8')[1:]
+    
+    return StreamingResponse(stream(), media_type='application/json')
+
+
+@app.get("/api/inbox/{inbox_id}/status", response_model=InboxStatusResponse)
+async def get_inbox_status(request: Request, inbox_id: str):
+    """
+    Get inbox status (lightweight endpoint for polling)
+    
+    Path Parameters:
+    - inbox_id: The inbox ID
+
+    Rate Limits:
+    - 60 requests per minute per IP and inbox (shared with the wait route)
+    - 120 polling requests per minute per IP across all inboxes
+    """
+    await rate_limit_middleware(request, 'polling', inbox_id)
+    return await inbox_status(inbox_id)
+
+
+@app.get("/api/inbox/{inbox_id}/wait", response_model=InboxStatusResponse)
+async def wait_for_emails(
+    request: Request,
+    inbox_id: str,
+    since: int = Query(default=0, ge=0),
+    timeout: int = Query(default=MAX_WAIT_SECONDS, ge=0, le=MAX_WAIT_SECONDS)
+):
+    """
+    Long-poll for new mail
+
+    Returns as soon as the inbox holds more than `since` emails, or after
+    `timeout` seconds with the unchanged status. Clients pass the
+    email_count from the previous response as the next `since`. Unless
+    LONG_POLL_ENABLED is set, answers immediately like the status route.
+    
+    Path Parameters:
+    - inbox_id: The inbox ID
+
+    Query Parameters:
+    - since: email_count the client has already seen (default: 0)
+    - timeout: Maximum seconds to wait (default and max: 25)
+
+    Rate Limits:
+    - 60 requests per minute per IP and inbox (shared with the status route)
+    - 120 polling requests per minute per IP across all inboxes
+    """
+    await rate_limit_middleware(request, 'polling', inbox_id)
+    try:
+        inbox = await get_cached_inbox(inbox_id)
+        if inbox is None or inbox.is_expired():
+            return await inbox_status(inbox_id)
+
+        async def current_count():
+            current = await storage.get_inbox(inbox_id)
+            return current.email_count if current is not None else 0
+
+        remaining = min(timeout, inbox.expires_at - time.time())
+        if LONG_POLL_ENABLED and remaining > 0:
+            await notification_hub.wait(inbox_id, since, remaining, probe=current_count)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to wait for emails: {str(e)}")
+
+    return await inbox_status(inbox_id)
+
+
 @app.get("/api/attachment/{inbox_id}/{email_id}/{attachment_id}")
-async def download_attachment(inbox_id: str, email_id: str, attachment_id: str):
+async def download_attachment(request: Request, inbox_id: str, email_id: str, attachment_id: str):
     """
     Get a pre-signed URL to download an attachment
     
@@ -357,22 +661,18 @@ async def download_attachment(inbox_id: str, email_id: str, attachment_id: str):
     - inbox_id: The inbox ID
     - email_id: The email ID
     - attachment_id: The attachment ID
+
+    Rate Limits:
+    - 100 requests per minute per IP and inbox
+    - 300 retrieval requests per minute per IP across all inboxes
     """
+    await rate_limit_middleware(request, 'retrieval', inbox_id)
     try:
         # Get email to find attachment
-        response = dynamodb.get_item(
-            TableName=EMAILS_TABLE,
-            Key={
-                'inbox_id': {'S': inbox_id},
-                'email_id': {'S': email_id}
-            }
-        )
-        
-        if 'Item' not in response:
+        email = await storage.get_email(inbox_id, email_id)
+        if email is None:
             raise HTTPException(status_code=404, detail="Email not found")
         
-        email = Email.from_dynamodb_item(response['Item'])
-        
         # Find the attachment
         attachment = None
         for att in email.attachments:
@@ -384,14 +684,9 @@ async def download_attachment(inbox_id: str, email_id: str, attachment_id: str):
             raise HTTPException(status_code=404, detail="Attachment not found")
         
         # Generate pre-signed URL (valid for 1 hour)
-        presigned_url = s3.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': S3_BUCKET,
-                'Key': attachment.s3_key,
-                'ResponseContentDisposition': f'attachment; filename="{attachment.filename}"'
-            },
-            ExpiresIn=3600
+        presigned_url = await storage.blob_download_url(
+            attachment.s3_key, attachment.filename, expires_in=3600,
+            content_type=attachment.content_type
         )
         
         return {
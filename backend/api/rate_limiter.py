@@ -0,0 +1,223 @@
+"""
+Per-client request rate limiting for the API
+"""
+import math
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request
+
+# Configuration
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true') == 'true'
+# local (per-process buckets) or dynamodb (buckets shared by every instance)
+RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'local')
+RATE_LIMIT_TABLE = os.getenv('DYNAMODB_RATE_LIMITS_TABLE', 'easytempinbox-rate-limits')
+RATE_LIMIT_SHARDS = int(os.getenv('RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', '100000'))
+
+# limit_type -> (requests, per seconds). Every route takes a token from one
+# of these buckets; buckets start full, so a client can burst up to the
+# full allowance and is then held to the average rate. For inbox routes
+# these are the per-inbox allowances, see IP_RATE_LIMITS.
+RATE_LIMITS = {
+    'create_inbox': (int(os.getenv('RATE_LIMIT_INBOX_CREATION_PER_HOUR', '10')), 3600),
+    # Counted per inbox created, not per request
+    'create_inbox_batch': (int(os.getenv('RATE_LIMIT_BATCH_INBOX_CREATION_PER_HOUR', '1000')), 3600),
+    'polling': (int(os.getenv('RATE_LIMIT_EMAIL_POLLING_PER_MINUTE', '60')), 60),
+    'retrieval': (int(os.getenv('RATE_LIMIT_EMAIL_RETRIEVAL_PER_MINUTE', '100')), 60),
+    'general': (int(os.getenv('RATE_LIMIT_GENERAL_PER_MINUTE', '300')), 60),
+}
+
+# Allowance per client IP across all inboxes for limit types whose routes
+# are also limited per inbox, so probing many inbox IDs is still capped
+IP_RATE_LIMITS = {
+    'polling': (int(os.getenv('RATE_LIMIT_EMAIL_POLLING_PER_IP_PER_MINUTE', '120')), 60),
+    'retrieval': (int(os.getenv('RATE_LIMIT_EMAIL_RETRIEVAL_PER_IP_PER_MINUTE', '300')), 60),
+}
+
+_limiter = None
+
+
+class LocalRateLimiter:
+    """
+    Token buckets held in this process
+
+    Each bucket is stored in GCRA form: a single "theoretical arrival time"
+    (TAT) per key, which is equivalent to a token bucket but needs no
+    separate refill step. A request costs one token (`interval` ms of TAT)
+    and is allowed while the TAT stays within `burst` ms of now.
+
+    Keys are spread over independently locked shards, each an LRU bounded to
+    its share of `max_keys`; an evicted key simply starts with a full bucket.
+    """
+
+    def __init__(self, shards: int = RATE_LIMIT_SHARDS, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self._shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self._max_keys_per_shard = max(1, max_keys // shards)
+
+    async def acquire(self, key: str, interval: int, burst: int, now: int) -> int:
+        """Take a token; returns 0 if allowed, otherwise ms until one is available"""
+        lock, buckets = self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+        with lock:
+            tat = max(buckets.get(key, 0), now) + interval
+            if tat - now > burst:
+                return tat - now - burst
+            buckets[key] = tat
+            buckets.move_to_end(key)
+            if len(buckets) > self._max_keys_per_shard:
+                buckets.popitem(last=False)
+        return 0
+
+
+class DynamoDBRateLimiter:
+    """
+    Token buckets shared through a DynamoDB table
+
+    Same GCRA buckets as LocalRateLimiter, one item per key ({key, tat,
+    expires_at}), updated with conditional writes so concurrent instances
+    never over-admit. A request costs one UpdateItem, or two when the
+    bucket has refilled completely. expires_at lets DynamoDB TTL delete
+    idle buckets.
+    """
+
+    MAX_ATTEMPTS = 3
+
+    def __init__(self, dynamodb, table: str = RATE_LIMIT_TABLE):
+        self.dynamodb = dynamodb
+        self.table = table
+
+    def _acquire(self, key: str, interval: int, burst: int, now: int) -> int:
+        from botocore.exceptions import ClientError
+
+        expires_at = {'N': str((now + burst) // 1000 + 1)}
+        for _ in range(self.MAX_ATTEMPTS):
+            # Bucket not full: advance the TAT if a token is left
+            try:
+                self.dynamodb.update_item(
+                    TableName=self.table,
+                    Key={'key': {'S': key}},
+                    UpdateExpression='SET tat = tat + :interval, expires_at = :expires_at',
+                    ConditionExpression='tat >= :now AND tat <= :max_tat',
+                    ExpressionAttributeValues={
+                        ':interval': {'N': str(interval)},
+                        ':now': {'N': str(now)},
+                        ':max_tat': {'N': str(now + burst - interval)},
+                        ':expires_at': expires_at
+                    },
+                    ReturnValuesOnConditionCheckFailure='ALL_OLD'
+                )
+                return 0
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                old = e.response.get('Item')
+
+            if old is not None and 'tat' in old:
+                tat = int(old['tat']['N'])
+                if tat > now + burst - interval:
+                    # Out of tokens
+                    return tat + interval - now - burst
+                if tat >= now:
+                    # Changed by another instance since the check; retry
+                    continue
+
+            # New or full bucket: start it from now
+            try:
+                self.dynamodb.update_item(
+                    TableName=self.table,
+                    Key={'key': {'S': key}},
+                    UpdateExpression='SET tat = :tat, expires_at = :expires_at',
+                    ConditionExpression='attribute_not_exists(tat) OR tat < :now',
+                    ExpressionAttributeValues={
+                        ':tat': {'N': str(now + interval)},
+                        ':now': {'N': str(now)},
+                        ':expires_at': expires_at
+                    }
+                )
+                return 0
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+            # Another instance updated the bucket in between; re-check
+        # Still contended: turn the request away rather than over-admit
+        return interval
+
+    async def acquire(self, key: str, interval: int, burst: int, now: int) -> int:
+        """Take a token; returns 0 if allowed, otherwise ms until one is available"""
+        from storage.aio import run_blocking
+        return await run_blocking(self._acquire, key, interval, burst, now)
+
+
+def get_rate_limiter():
+    """Get the process-wide rate limiter selected by RATE_LIMIT_BACKEND"""
+    global _limiter
+    if _limiter is None:
+        if RATE_LIMIT_BACKEND == 'local':
+            _limiter = LocalRateLimiter()
+        elif RATE_LIMIT_BACKEND == 'dynamodb':
+            from storage.factory import create_aws_clients
+            dynamodb, _ = create_aws_clients()
+            _limiter = DynamoDBRateLimiter(dynamodb)
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {RATE_LIMIT_BACKEND}")
+    return _limiter
+
+
+def client_ip(request: Request) -> str:
+    """Address of the caller (API Gateway's source IP under Mangum)"""
+    return request.client.host if request.client else 'unknown'
+
+
+async def rate_limit_middleware(request: Request, limit_type: str, scope: Optional[str] = None,
+                                cost: int = 1) -> None:
+    """
+    Take `cost` tokens from the caller's bucket for `limit_type`
+
+    Every request is charged to the client IP's bucket. When `scope` (e.g.
+    an inbox ID) is given, the IP bucket uses IP_RATE_LIMITS and a second
+    bucket per IP and scope is charged as well. Raises a 429 with
+    Retry-After once a bucket is empty. Limiter failures are logged and let
+    the request through.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return
+
+    key = f"{limit_type}:{client_ip(request)}"
+    if scope:
+        buckets = [
+            (key, IP_RATE_LIMITS.get(limit_type, RATE_LIMITS[limit_type])),
+            (f"{key}:{scope}", RATE_LIMITS[limit_type])
+        ]
+    else:
+        buckets = [(key, RATE_LIMITS[limit_type])]
+
+    for key, (requests, period) in buckets:
+        await _take_tokens(key, requests, period, cost)
+
+
+async def _take_tokens(key: str, requests: int, period: int, cost: int) -> None:
+    """Take `cost` tokens from one bucket, raising a 429 if it is empty"""
+    interval = period * 1000 // requests
+    burst = interval * requests
+
+    try:
+        wait_ms = await get_rate_limiter().acquire(key, interval * cost, burst, int(time.time() * 1000))
+    except Exception as e:
+        print(f"Rate limiter error: {e}")
+        return
+
+    if wait_ms > 0:
+        retry_after = math.ceil(wait_ms / 1000)
+        raise HTTPException(
+            status_code=429,
+            detail={
+                'error': 'rate_limit_exceeded',
+                'message': 'Too many requests, please slow down',
+                'retry_after': retry_after
+            },
+            headers={'Retry-After': str(retry_after)}
+        )
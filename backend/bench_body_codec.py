@@ -0,0 +1,111 @@
+"""
+Benchmark the compressed body encoding of email items
+
+For each .eml fixture (plus any .eml paths given on the command line), builds
+the emails-table item with plain string bodies (the legacy layout) and with
+the pre-serialized gzip detail response that replaced them, and reports item
+size, read units and the time spent encoding and decoding the bodies.
+
+Usage: python bench_body_codec.py [extra.eml ...]
+"""
+import math
+import os
+import sys
+import time
+from email import policy
+from email.parser import BytesParser
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models.email import Email, encode_detail, decode_detail
+
+ROUNDS = 200
+READ_UNIT = 4096
+
+
+def attribute_size(value: dict) -> int:
+    """Approximate DynamoDB size of an attribute value"""
+    (kind, data), = value.items()
+    if kind == 'S':
+        return len(data.encode('utf-8'))
+    if kind == 'B':
+        return len(data)
+    if kind == 'N':
+        return len(data.lstrip('-').replace('.', '')) // 2 + 1
+    if kind == 'BOOL':
+        return 1
+    if kind == 'L':
+        return 3 + sum(attribute_size(v) + 1 for v in data)
+    if kind == 'M':
+        return 3 + sum(len(k) + attribute_size(v) + 1 for k, v in data.items())
+    raise ValueError(kind)
+
+
+def item_size(item: dict) -> int:
+    """Approximate DynamoDB size of an item (names plus values)"""
+    return sum(len(name) + attribute_size(value) for name, value in item.items())
+
+
+def load_email(path: str) -> Email:
+    """Build an Email from the text and HTML parts of an .eml file"""
+    with open(path, 'rb') as f:
+        msg = BytesParser(policy=policy.default).parse(f)
+    bodies = {'text/plain': '', 'text/html': ''}
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        if content_type in bodies and not bodies[content_type] and not part.is_attachment():
+            bodies[content_type] = part.get_content()
+    return Email.create(
+        inbox_id='abcd1234',
+        from_address=str(msg.get('From', '')),
+        subject=str(msg.get('Subject', '')),
+        text_body=bodies['text/plain'],
+        html_body=bodies['text/html'],
+        received_at=int(time.time())
+    )
+
+
+def timed(func, *args) -> float:
+    """Average microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - start) / ROUNDS * 1e6
+
+
+def bench(path: str) -> tuple:
+    email = load_email(path)
+    encoded = email.to_dynamodb_item()
+    legacy = dict(encoded, text_body={'S': email.text_body}, html_body={'S': email.html_body})
+    del legacy['detail']
+    
+    raw_size = item_size(legacy)
+    encoded_size = item_size(encoded)
+    encode_us = timed(lambda: encode_detail(email.detail_response()))
+    decode_us = timed(lambda: decode_detail(encoded['detail']['B']))
+    assert decode_detail(encoded['detail']['B']) == email.detail_response()
+    
+    print(f"{os.path.basename(path)}")
+    print(f"  item size:   {raw_size} B as strings, {encoded_size} B encoded "
+          f"({raw_size / encoded_size:.2f}x)")
+    print(f"  GetItem RCU: {math.ceil(raw_size / READ_UNIT)} -> {math.ceil(encoded_size / READ_UNIT)} "
+          f"(strongly consistent)")
+    print(f"  encode {encode_us:.1f} us, decode {decode_us:.1f} us per email")
+    return raw_size, encoded_size
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    paths = sorted(os.path.join(here, name) for name in os.listdir(here) if name.endswith('.eml'))
+    paths += sys.argv[1:]
+    
+    total_raw = total_encoded = 0
+    for path in paths:
+        raw_size, encoded_size = bench(path)
+        total_raw += raw_size
+        total_encoded += encoded_size
+    
+    # Storage and transfer scale with bytes; reads round up per item to 4KB,
+    # so small items only save once they cross a read-unit boundary
+    print(f"Total: {total_raw} B -> {total_encoded} B ({total_raw / total_encoded:.2f}x) "
+          f"over {len(paths)} email(s)")
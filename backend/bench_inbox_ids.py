@@ -0,0 +1,61 @@
+"""
+Benchmark inbox ID generation and report collision odds
+
+Times the per-character secrets.choice generator against generate_inbox_ids
+(one secrets.token_bytes draw mapped onto the alphabet), checks the new
+generator's character distribution, and prints how the chance of an ID
+collision grows with the number of live inboxes.
+
+Usage: python bench_inbox_ids.py [count]
+"""
+import os
+import secrets
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from models.inbox import (
+    INBOX_ID_ALPHABET, INBOX_ID_LENGTH, INBOX_ID_SPACE, generate_inbox_ids, inbox_id_collision_report
+)
+
+CREATE_ATTEMPTS = int(os.getenv('INBOX_CREATE_ATTEMPTS', '3'))
+
+
+def choice_ids(count):
+    """The previous generator: one secrets.choice call per character"""
+    return [''.join(secrets.choice(INBOX_ID_ALPHABET) for _ in range(INBOX_ID_LENGTH)) for _ in range(count)]
+
+
+def timed(func, count) -> float:
+    start = time.perf_counter()
+    func(count)
+    return time.perf_counter() - start
+
+
+def check_distribution(count):
+    """Chi-square statistic of character frequencies (35 degrees of freedom)"""
+    counts = Counter(''.join(generate_inbox_ids(count)))
+    expected = count * INBOX_ID_LENGTH / len(INBOX_ID_ALPHABET)
+    chi2 = sum((counts[c] - expected) ** 2 / expected for c in INBOX_ID_ALPHABET)
+    # 99.9th percentile of chi-square with 35 degrees of freedom
+    print(f"Character distribution: chi-square {chi2:.1f} (uniform if below ~66.6)")
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    
+    choice_time = timed(choice_ids, count)
+    token_time = timed(generate_inbox_ids, count)
+    print(f"secrets.choice:     {choice_time * 1e3:.1f} ms for {count} IDs")
+    print(f"generate_inbox_ids: {token_time * 1e3:.1f} ms ({choice_time / token_time:.0f}x)")
+    check_distribution(count)
+    
+    print(f"\nID space: {INBOX_ID_SPACE:,} ({len(INBOX_ID_ALPHABET)}^{INBOX_ID_LENGTH}), "
+          f"{CREATE_ATTEMPTS} attempt(s) per creation")
+    print(f"{'live inboxes':>14} {'P(collision)':>14} {'P(all fail)':>14} {'writes/inbox':>14}")
+    for live in (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8, 10 ** 9):
+        report = inbox_id_collision_report(live, CREATE_ATTEMPTS)
+        print(f"{live:>14,} {report['collision_probability']:>14.2e} "
+              f"{report['failure_probability']:>14.2e} {report['expected_writes']:>14.6f}")
@@ -0,0 +1,147 @@
+"""
+Benchmark the parser's HTML sanitizer against plain bleach.clean
+
+Checks that sanitize_html() output, and the HTML half of
+sanitize_html_with_text(), is byte-identical to calling bleach.clean with the
+same ALLOWED_TAGS/ALLOWED_ATTRIBUTES/ALLOWED_PROTOCOLS policy, then times both
+on a repeated newsletter-style workload. The sanitizer deliberately drops
+head/title/style/script elements first (bleach.clean would show their text),
+so the reference does the same.
+
+Usage: python bench_sanitizer.py [rounds]
+"""
+import os
+import random
+import sys
+import time
+import warnings
+from email import policy
+from email.parser import BytesParser
+
+# The parser module creates a storage backend on import; no AWS needed here
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('RECIPIENT_FILTER_ENABLED', 'false')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lambda'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bleach
+import email_parser
+from email_parser import (
+    sanitize_html, sanitize_html_with_text, html_sanitizer, ALLOWED_TAGS, ALLOWED_ATTRIBUTES,
+    ALLOWED_PROTOCOLS, _HIDDEN_ELEMENTS
+)
+
+warnings.filterwarnings('ignore', category=bleach.sanitizer.NoCssSanitizerWarning)
+
+
+def reference_clean(html_content):
+    """The original per-call sanitizer, minus hidden elements"""
+    if not html_content:
+        return ""
+    return bleach.clean(
+        _HIDDEN_ELEMENTS.sub('', html_content),
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
+        strip=True
+    )
+
+
+def fixture_bodies():
+    """HTML bodies of the .eml fixtures next to this script"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    bodies = []
+    for name in sorted(os.listdir(here)):
+        if not name.endswith('.eml'):
+            continue
+        with open(os.path.join(here, name), 'rb') as f:
+            msg = BytesParser(policy=policy.default).parse(f)
+        for part in msg.walk():
+            if part.get_content_type() == 'text/html':
+                bodies.append(part.get_content())
+    return bodies
+
+
+def newsletter(n):
+    """A templated newsletter with some per-recipient variation"""
+    rows = ''.join(
+        f'<tr><td style="padding:4px" align="left">Item {i}</td>'
+        f'<td><a href="https://example.com/p/{i}?u={n}" onclick="track()">View &amp; buy</a></td></tr>'
+        for i in range(40)
+    )
+    return (
+        '<html><head><style>p {color: red}</style><script>alert(1)</script></head>'
+        f'<body><div class="wrap"><h1>Weekly deals</h1><table width="600">{rows}</table>'
+        '<img src="https://example.com/logo.png" alt="logo" onerror="x()">'
+        '<p>Unsubscribe <a href="javascript:alert(1)">here</a></p></div></body></html>'
+    )
+
+
+def random_bodies(count, seed=1234):
+    """Random strings over markup, entities, control and non-ASCII characters"""
+    rng = random.Random(seed)
+    alphabet = list('abc xyz\t\n"\'=/;#') + ['<', '>', '&', '\r', '\0', '\x0c', '\x01', '\x7f',
+                                               'é', '€', '\xa0', '\ufeff', '😀', '\x85', '\u2028',
+                                               '\ufffe', '\ufdd0', '\U0010ffff']
+    snippets = ['<b>', '</b>', '<script>', '</script>', '<a href="', '&amp;', '&lt;', '&#0;',
+                '&nbsp', '<!--', '-->', '<![CDATA[', '<pre>\n', '<td>', '<img src=x>']
+    bodies = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.randint(0, 30)):
+            if rng.random() < 0.3:
+                parts.append(rng.choice(snippets))
+            else:
+                parts.append(rng.choice(alphabet))
+        bodies.append(''.join(parts))
+    return bodies
+
+
+def plain_bodies(count, seed=99):
+    """Markup-free bodies, which take the fast path"""
+    rng = random.Random(seed)
+    alphabet = list('abcdefghij klmnop\t\n"\'=/;#.,') + ['é', '€', '\xa0', '\x7f', '\x85', '\ufffe', '😀']
+    return [''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 200))) for _ in range(count)]
+
+
+def check_identical():
+    """Compare output on every corpus, with the cache cold and warm"""
+    corpus = fixture_bodies() + [newsletter(i) for i in range(20)] + random_bodies(3000) + plain_bodies(1000)
+    mismatches = 0
+    for _ in range(2):
+        for body in corpus:
+            expected = reference_clean(body)
+            for actual in (sanitize_html(body), sanitize_html_with_text(body)[0]):
+                if actual != expected:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print(f"MISMATCH for {body!r}:\n  bleach:   {expected!r}\n  sanitize: {actual!r}")
+    print(f"Compared {4 * len(corpus)} outputs: {mismatches} mismatch(es)")
+    return mismatches == 0
+
+
+def bench(rounds):
+    """Time a workload where a few templates repeat across many messages"""
+    workload = [newsletter(i % 10) for i in range(rounds)] + plain_bodies(rounds)
+    
+    start = time.perf_counter()
+    for body in workload:
+        reference_clean(body)
+    reference_time = time.perf_counter() - start
+    
+    email_parser.html_sanitizer = type(html_sanitizer)()
+    start = time.perf_counter()
+    for body in workload:
+        email_parser.html_sanitizer.clean(body)
+    engine_time = time.perf_counter() - start
+    
+    print(f"bleach.clean:  {reference_time:.3f}s for {len(workload)} bodies")
+    print(f"sanitize_html: {engine_time:.3f}s ({reference_time / engine_time:.1f}x), "
+          f"cache {email_parser.html_sanitizer.stats()}")
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    identical = check_identical()
+    bench(rounds)
+    sys.exit(0 if identical else 1)
@@ -0,0 +1,109 @@
+"""
+Benchmark item -> JSON rendering for the email list and detail routes
+
+Compares the pydantic path (item -> model -> response model -> validated
+and encoded by FastAPI) with the slot-based records and direct encoders the
+routes use, on a 100-item list page and a detail item with attachments.
+Both paths must render identical JSON.
+
+Usage: python bench_serialization.py [rounds]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from models.email import (
+    Email, EmailListItem, EmailListResponse, EmailDetailResponse, AttachmentInfo, AttachmentResponse,
+    EmailSummary, EmailRecord, email_list_response
+)
+
+PAGE_SIZE = 100
+
+
+def sample_email(n: int, attachments: int = 0) -> Email:
+    return Email.create(
+        inbox_id='abcd1234',
+        from_address=f'Sender {n} <sender{n}@example.com>',
+        subject=f'Your weekly digest #{n} – deals inside',
+        text_body='Hello there, here is your digest.\n' * 20,
+        html_body='<p>Hello there, here is <b>your</b> digest.</p>' * 20,
+        received_at=1769499000 + n,
+        attachments=[
+            AttachmentInfo(id=f'att-{i}', filename=f'file{i}.pdf', content_type='application/pdf',
+                           size=1000 * i, s3_key=f'attachments/abcd1234/x/att-{i}/file{i}.pdf')
+            for i in range(attachments)
+        ]
+    )
+
+
+def summary_item(item: dict) -> dict:
+    """The list projection of an item"""
+    return {name: item[name] for name in
+            ('email_id', 'from', 'subject', 'received_at', 'has_html', 'attachment_count')}
+
+
+def fastapi_render(model_class, content) -> bytes:
+    """What FastAPI does with a returned model: validate, encode, render"""
+    validated = model_class.model_validate(content, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def list_pydantic(items):
+    emails = [EmailListItem.from_dynamodb_item(item) for item in items]
+    return fastapi_render(EmailListResponse, EmailListResponse(emails=emails, count=len(emails), last_key='k'))
+
+
+def list_direct(items):
+    return JSONResponse(email_list_response([EmailSummary(item) for item in items], 'k')).body
+
+
+def detail_pydantic(item):
+    email = Email.from_dynamodb_item(item)
+    attachments = [
+        AttachmentResponse(id=a.id, filename=a.filename, content_type=a.content_type, size=a.size)
+        for a in email.attachments
+    ]
+    return fastapi_render(EmailDetailResponse, EmailDetailResponse(
+        email_id=email.email_id,
+        from_address=email.from_address,
+        subject=email.subject,
+        text_body=email.text_body,
+        html_body=email.html_body,
+        received_at=email.received_at,
+        attachments=attachments
+    ))
+
+
+def detail_direct(item):
+    return JSONResponse(EmailRecord(item).to_response()).body
+
+
+def timed(func, arg, rounds: int) -> float:
+    """Average microseconds per call"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(arg)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    page = [summary_item(sample_email(n, n % 3).to_dynamodb_item()) for n in range(PAGE_SIZE)]
+    detail = sample_email(0, attachments=5).to_dynamodb_item()
+    
+    assert list_pydantic(page) == list_direct(page), "list payloads differ"
+    assert detail_pydantic(detail) == detail_direct(detail), "detail payloads differ"
+    print("Payloads identical")
+    
+    for name, old, new, arg in [
+        (f'list page ({PAGE_SIZE} items)', list_pydantic, list_direct, page),
+        ('detail (5 attachments)', detail_pydantic, detail_direct, detail),
+    ]:
+        old_us = timed(old, arg, rounds)
+        new_us = timed(new, arg, rounds)
+        print(f"{name}: pydantic {old_us:.0f} us, direct {new_us:.0f} us ({old_us / new_us:.1f}x)")
@@ -5,22 +5,73 @@ import os
 import json
 import email
 import time
-import boto3
-import bleach
+import quopri
+import binascii
+import hashlib
+import html
+import re
+import threading
+from bleach.sanitizer import BleachSanitizerFilter, Cleaner, INVISIBLE_CHARACTERS
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote_plus
 from email import policy
-from email.parser import BytesParser
+from email.utils import getaddresses
+from email.header import decode_header, make_header
+from email.parser import BytesParser, BytesFeedParser
 
-# AWS clients
-s3 = boto3.client('s3')
-dynamodb = boto3.client('dynamodb')
+from models.email import (
+    Email, AttachmentInfo, generate_email_id, large_body_key, attachment_blob_key, pack_bodies,
+    BODY_INLINE_MAX_BYTES
+)
+from storage.factory import get_storage_backend
+from storage.cache import get_inbox_cache
+from storage.notify import get_notification_hub
+from storage.recipients import RecipientFilter, RECIPIENT_FILTER_ENABLED
+
+# Storage backend (DynamoDB + S3 by default, see storage/factory.py)
+storage = get_storage_backend()
+inbox_cache = get_inbox_cache()
+notification_hub = get_notification_hub()
+# Snapshot of live inbox IDs, refreshed from the inboxes table, so mail for
+# addresses that cannot exist is dropped without any per-message lookup
+recipient_filter = RecipientFilter(storage.scan_live_inboxes) if RECIPIENT_FILTER_ENABLED else None
 
 # Configuration
-INBOXES_TABLE = os.getenv('DYNAMODB_INBOXES_TABLE', 'easytempinbox-inboxes')
-EMAILS_TABLE = os.getenv('DYNAMODB_EMAILS_TABLE', 'easytempinbox-emails')
 S3_BUCKET = os.getenv('S3_BUCKET_NAME', 'easytempinbox-raw-emails')
-MAX_TEXT_BODY_SIZE = int(os.getenv('MAX_TEXT_BODY_SIZE', '102400'))  # 100KB
-MAX_HTML_BODY_SIZE = int(os.getenv('MAX_HTML_BODY_SIZE', '204800'))  # 200KB
+# Object key prefix of the SES receipt rule's S3 action (for SES-invoked runs)
+SES_OBJECT_KEY_PREFIX = os.getenv('SES_OBJECT_KEY_PREFIX', '')
+# Domains whose addresses are inboxes; empty accepts recipients at any domain
+ALLOWED_DOMAINS = {
+    domain.strip().lower() for domain in os.getenv('ALLOWED_DOMAINS', '').split(',') if domain.strip()
+}
 MAX_EMAILS_PER_INBOX = int(os.getenv('MAX_EMAILS_PER_INBOX', '50'))
+# Upper bound on how long an inbox receiving mail now can still live
+MAX_TTL = int(os.getenv('MAX_TTL_SECONDS', '86400'))
+# Records in one invocation are fetched, parsed and stored concurrently
+PARSER_WORKERS = int(os.getenv('PARSER_WORKERS', '8'))
+# Attachments of one email upload concurrently, decoded a chunk at a time
+ATTACHMENT_UPLOAD_WORKERS = int(os.getenv('ATTACHMENT_UPLOAD_WORKERS', '8'))
+ATTACHMENT_CHUNK_SIZE = int(os.getenv('ATTACHMENT_CHUNK_SIZE', str(1024 * 1024)))
+# How long a stored attachment blob survives (the bucket's lifecycle
+# expiration); older copies are uploaded again rather than reused
+ATTACHMENT_BLOB_RETENTION_SECONDS = int(os.getenv('ATTACHMENT_BLOB_RETENTION_SECONDS', '172800'))
+# Raw emails are read from S3 in chunks of this size, headers first
+EMAIL_READ_SIZE = int(os.getenv('EMAIL_READ_SIZE', str(64 * 1024)))
+MAX_HEADER_SIZE = int(os.getenv('MAX_HEADER_SIZE', str(1024 * 1024)))
+# Longest subject, from address or attachment filename stored; headers may
+# be up to MAX_HEADER_SIZE, far more than fits in a 400KB item
+MAX_HEADER_FIELD_CHARS = int(os.getenv('MAX_HEADER_FIELD_CHARS', '998'))
+# Sanitized HTML bodies kept per container, keyed by content hash
+SANITIZER_CACHE_SIZE = int(os.getenv('SANITIZER_CACHE_SIZE', '256'))
+# ...bounded by their total length, with larger bodies never cached
+SANITIZER_CACHE_MAX_CHARS = int(os.getenv('SANITIZER_CACHE_MAX_CHARS', str(32 * 1024 * 1024)))
+SANITIZER_CACHE_MAX_BODY_CHARS = int(os.getenv('SANITIZER_CACHE_MAX_BODY_CHARS', str(256 * 1024)))
+
+# Shared across invocations; separate from the per-batch parser pool so
+# nested submits cannot deadlock
+upload_pool = ThreadPoolExecutor(max_workers=ATTACHMENT_UPLOAD_WORKERS)
 
 # HTML sanitization settings
 ALLOWED_TAGS = [
@@ -48,74 +99,416 @@ ALLOWED_ATTRIBUTES = {
 ALLOWED_PROTOCOLS = ['http', 'https', 'mailto', 'tel']
 
 
-def sanitize_html(html_content: str) -> str:
-    """Sanitize HTML content to prevent XSS attacks"""
-    if not html_content:
-        return ""
+# Characters that html5lib/bleach rewrite in text content (escaping, CR
+# normalization, invisible control characters); HTML with none of them
+# sanitizes to itself
+_MARKUP_CHARS = re.compile('[<>&\r' + INVISIBLE_CHARACTERS + ']')
+_WHITESPACE = re.compile(r'\s+')
+
+# Text rendering of HTML bodies: elements that start a new paragraph or line
+_TEXT_PARAGRAPH_TAGS = frozenset({
+    'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'ul', 'ol', 'table', 'hr'
+})
+_TEXT_LINE_TAGS = frozenset({'div', 'li', 'tr', 'thead', 'tbody', 'center', 'address'})
+# Elements whose content a mail client never displays. bleach turns their
+# tags into text (leaving CSS/JS visible), so they are cut from the input
+# before sanitizing.
+_HIDDEN_ELEMENTS = re.compile(
+    r'<(head|title|style|script)\b[^>]*>.*?</\1\s*>', re.IGNORECASE | re.DOTALL
+)
+
+
+def render_html_text(dom) -> str:
+    """
+    Plain-text rendering of an HTML fragment parsed by a bleach Cleaner
+
+    Whitespace is collapsed as a browser would (except inside pre), block
+    elements become lines and paragraphs, list items get a "- " bullet and
+    http(s) link targets are kept in parentheses after the link text. The
+    tree holds entities unresolved, so text is unescaped here. Tags bleach
+    strips are already gone from the tree and their text content is kept,
+    so parse input with _HIDDEN_ELEMENTS removed.
+    """
+    parts = []
+    pre_depth = 0
     
-    return bleach.clean(
-        html_content,
-        tags=ALLOWED_TAGS,
-        attributes=ALLOWED_ATTRIBUTES,
-        protocols=ALLOWED_PROTOCOLS,
-        strip=True
-    )
+    def emit(text: str) -> None:
+        if not pre_depth:
+            text = _WHITESPACE.sub(' ', text)
+            if not parts or parts[-1].endswith(('\n', ' ')):
+                text = text.lstrip(' ')
+        if text:
+            parts.append(text)
+    
+    def break_line(blank_line: bool) -> None:
+        while parts and not parts[-1].strip(' '):
+            parts.pop()
+        if not parts:
+            return
+        parts[-1] = parts[-1].rstrip(' ')
+        trailing = len(parts[-1]) - len(parts[-1].rstrip('\n'))
+        needed = (2 if blank_line else 1) - trailing
+        if needed > 0:
+            parts.append('\n' * needed)
+    
+    # (node, closing, index of the node's first part) in document order
+    stack = [(dom, False, 0)]
+    while stack:
+        node, closing, start = stack.pop()
+        tag = node.tag if isinstance(node.tag, str) else None
+        if closing:
+            if tag == 'pre':
+                pre_depth -= 1
+            if tag == 'a':
+                href = node.get('href', '')
+                if href.startswith(('http://', 'https://')) and html.unescape(href) != ''.join(parts[start:]).strip():
+                    emit(f" ({html.unescape(href)})")
+            elif tag in ('td', 'th'):
+                emit(' ')
+            elif tag in _TEXT_PARAGRAPH_TAGS:
+                break_line(True)
+            elif tag in _TEXT_LINE_TAGS:
+                break_line(False)
+            if node.tail:
+                emit(html.unescape(node.tail))
+            continue
+        
+        if tag is None:
+            # Comment; only the text after it is content
+            if node.tail:
+                emit(html.unescape(node.tail))
+            continue
+        if tag == 'br':
+            parts.append('\n')
+        elif tag in _TEXT_PARAGRAPH_TAGS:
+            break_line(True)
+            if tag == 'hr':
+                parts.append('---')
+        elif tag in _TEXT_LINE_TAGS:
+            break_line(False)
+            if tag == 'li':
+                parts.append('- ')
+        if tag == 'pre':
+            pre_depth += 1
+        stack.append((node, True, len(parts)))
+        if node.text:
+            emit(html.unescape(node.text))
+        stack.extend((child, False, 0) for child in reversed(node))
+    
+    text = ''.join(parts)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
 
 
-def extract_inbox_id_from_email(to_address: str) -> str:
-    """Extract inbox ID from email address"""
-    # Format: inbox_id@domain.com
-    if '@' in to_address:
-        return to_address.split('@')[0].strip('<>').lower()
-    return to_address
+class HtmlSanitizer:
+    """
+    Sanitizer for HTML bodies with the same output as bleach.clean
 
+    The one difference: head, title, style and script elements are removed
+    with their content first, where bleach.clean would leave their CSS/JS
+    text in the output.
 
-def check_inbox_exists(inbox_id: str) -> bool:
-    """Check if inbox exists and is not expired"""
-    try:
-        response = dynamodb.get_item(
-            TableName=INBOXES_TABLE,
-            Key={'id': {'S': inbox_id}}
+    One bleach Cleaner is built per thread, since a Cleaner holds parser
+    state and must not be shared between concurrent calls. Bodies with no
+    markup characters skip the parse entirely, and sanitized output is kept
+    in an LRU keyed by the SHA-256 of the input, so repeated newsletter
+    templates are parsed once per container. The LRU is bounded by entry
+    count and by total characters held; bodies longer than max_body_chars
+    are not cached at all.
+    """
+
+    def __init__(self, max_entries: int = SANITIZER_CACHE_SIZE,
+                 max_chars: int = SANITIZER_CACHE_MAX_CHARS,
+                 max_body_chars: int = SANITIZER_CACHE_MAX_BODY_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.max_body_chars = max_body_chars
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # digest -> (sanitized HTML, text rendering or None if not made yet)
+        self._entries: 'OrderedDict[bytes, Tuple[str, Optional[str]]]' = OrderedDict()
+        # Characters held by _entries
+        self._chars = 0
+
+    def _cleaner(self) -> Cleaner:
+        cleaner = getattr(self._local, 'cleaner', None)
+        if cleaner is None:
+            cleaner = self._local.cleaner = Cleaner(
+                tags=ALLOWED_TAGS,
+                attributes=ALLOWED_ATTRIBUTES,
+                protocols=ALLOWED_PROTOCOLS,
+                strip=True
+            )
+        return cleaner
+
+    def _sanitize(self, html_content: str, with_text: bool) -> Tuple[str, Optional[str]]:
+        """Bleach's Cleaner.clean, keeping the parse tree for render_html_text"""
+        cleaner = self._cleaner()
+        dom = cleaner.parser.parseFragment(_HIDDEN_ELEMENTS.sub('', html_content))
+        filtered = BleachSanitizerFilter(
+            source=cleaner.walker(dom),
+            allowed_tags=cleaner.tags,
+            attributes=cleaner.attributes,
+            strip_disallowed_tags=cleaner.strip,
+            strip_html_comments=cleaner.strip_comments,
+            css_sanitizer=cleaner.css_sanitizer,
+            allowed_protocols=cleaner.protocols
         )
+        cleaned = cleaner.serializer.render(filtered)
+        return cleaned, render_html_text(dom) if with_text else None
+
+    def clean(self, html_content: str, with_text: bool = False):
+        """
+        Sanitize an HTML body
+
+        With with_text, returns (sanitized HTML, plain-text rendering), both
+        from a single parse; otherwise just the sanitized HTML.
+        """
+        if not html_content:
+            return ("", "") if with_text else ""
+        if not _MARKUP_CHARS.search(html_content):
+            return (html_content, _WHITESPACE.sub(' ', html_content).strip()) if with_text else html_content
+        if len(html_content) > self.max_body_chars:
+            entry = self._sanitize(html_content, with_text)
+            return entry if with_text else entry[0]
         
-        if 'Item' not in response:
-            return False
+        digest = hashlib.sha256(html_content.encode('utf-8', 'surrogatepass')).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and (entry[1] is not None or not with_text):
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry if with_text else entry[0]
+            self.misses += 1
         
-        expires_at = int(response['Item']['expires_at']['N'])
-        return time.time() < expires_at
-    except Exception as e:
-        print(f"Error checking inbox: {e}")
-        return False
+        entry = self._sanitize(html_content, with_text)
+        with self._lock:
+            old = self._entries.pop(digest, None)
+            if old is not None:
+                self._chars -= _entry_chars(old)
+            self._entries[digest] = entry
+            self._chars += _entry_chars(entry)
+            while len(self._entries) > self.max_entries or self._chars > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= _entry_chars(evicted)
+        return entry if with_text else entry[0]
 
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'chars': self._chars}
 
-def count_emails_in_inbox(inbox_id: str) -> int:
-    """Count number of emails in inbox"""
-    try:
-        response = dynamodb.query(
-            TableName=EMAILS_TABLE,
-            KeyConditionExpression='inbox_id = :inbox_id',
-            ExpressionAttributeValues={':inbox_id': {'S': inbox_id}},
-            Select='COUNT'
-        )
-        return response.get('Count', 0)
-    except Exception as e:
-        print(f"Error counting emails: {e}")
-        return 0
+
+def _entry_chars(entry: Tuple[str, Optional[str]]) -> int:
+    return len(entry[0]) + len(entry[1] or '')
+
+
+html_sanitizer = HtmlSanitizer()
+
+
+def sanitize_html(html_content: str) -> str:
+    """Sanitize HTML content to prevent XSS attacks"""
+    return html_sanitizer.clean(html_content)
+
+
+def sanitize_html_with_text(html_content: str) -> Tuple[str, str]:
+    """Sanitize HTML content and render it as plain text from the same parse"""
+    return html_sanitizer.clean(html_content, with_text=True)
 
 
-def parse_email_from_s3(bucket: str, key: str) -> dict:
-    """Parse email from S3 object"""
-    # Get email from S3
-    response = s3.get_object(Bucket=bucket, Key=key)
-    raw_email = response['Body'].read()
+def extract_recipient_inbox_ids(addresses: Iterable[str]) -> List[str]:
+    """
+    Inbox IDs addressed by a list of address headers or envelope recipients
+
+    Each entry may hold several comma-separated addresses with display
+    names. Addresses outside ALLOWED_DOMAINS are skipped; IDs are returned
+    once each, in order of appearance.
+    """
+    inbox_ids = []
+    for _, address in getaddresses([str(value) for value in addresses]):
+        local, at, domain = address.rpartition('@')
+        if not at or not local:
+            continue
+        if ALLOWED_DOMAINS and domain.lower() not in ALLOWED_DOMAINS:
+            continue
+        inbox_id = local.lower()
+        if inbox_id not in inbox_ids:
+            inbox_ids.append(inbox_id)
+    return inbox_ids
+
+
+def get_live_inbox_ids(inbox_ids) -> set:
+    """
+    Check many inboxes at once, returning the IDs of the live ones
+
+    The recipient filter answers for malformed IDs and inboxes in its
+    snapshot. Cached entries are used as-is; the rest are fetched with a
+    single batched read and added to the cache and the filter.
+    """
+    live = set()
+    missing = []
+    for inbox_id in set(inbox_ids):
+        verdict = recipient_filter.check(inbox_id) if recipient_filter else None
+        if verdict is not None:
+            if verdict:
+                live.add(inbox_id)
+            continue
+        found, inbox = inbox_cache.lookup(inbox_id)
+        if not found:
+            missing.append(inbox_id)
+        elif inbox is not None and not inbox.is_expired():
+            live.add(inbox_id)
     
-    # Parse email
-    msg = BytesParser(policy=policy.default).parsebytes(raw_email)
+    if missing:
+        loaded = storage.get_inboxes(missing)
+        for inbox_id in missing:
+            inbox = loaded.get(inbox_id)
+            inbox_cache.store(inbox_id, inbox)
+            if inbox is not None and not inbox.is_expired():
+                live.add(inbox_id)
+                if recipient_filter:
+                    recipient_filter.add(inbox_id, inbox.expires_at)
     
+    return live
+
+
+def iter_attachment_chunks(part, chunk_size: int = ATTACHMENT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Decode an attachment's payload incrementally
+
+    base64 and quoted-printable payloads are decoded slice by slice from the
+    encoded text, so no full decoded copy of the attachment is built. This
+    does not bound memory per attachment: the encoded text itself (and the
+    rest of the message) stays in the parsed message tree until the email
+    is stored, and upload_attachment decodes each payload twice.
+    """
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    payload = part.get_payload()
+    
+    if not isinstance(payload, str) or encoding not in ('base64', 'quoted-printable'):
+        data = part.get_payload(decode=True) or b''
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+        return
+    
+    # Encoded characters per slice (base64 turns 3 bytes into 4 characters)
+    step = max(4, chunk_size // 3 * 4)
+    carry = ''
+    for start in range(0, len(payload), step):
+        piece = carry + payload[start:start + step]
+        if encoding == 'base64':
+            # Drop line breaks and decode whole 4-character groups only
+            piece = ''.join(piece.split())
+            usable = len(piece) - len(piece) % 4
+        else:
+            # Split quoted-printable only after a line break
+            usable = piece.rfind('\n') + 1
+        carry = piece[usable:]
+        if usable:
+            yield _decode_slice(piece[:usable], encoding)
+    
+    if carry.strip():
+        if encoding == 'base64':
+            carry = carry.strip() + '=' * (-len(carry.strip()) % 4)
+        yield _decode_slice(carry, encoding)
+
+
+def _decode_slice(text: str, encoding: str) -> bytes:
+    if encoding == 'base64':
+        try:
+            return binascii.a2b_base64(text.encode('ascii', 'ignore'))
+        except binascii.Error:
+            return b''
+    return quopri.decodestring(text.encode('raw-unicode-escape'))
+
+
+class IncomingEmail:
+    """
+    A raw email read from S3 headers-first
+
+    Opening one reads only up to the end of the header block, which is
+    parsed on its own so the recipient can be checked before the body is
+    downloaded. parse() then streams the rest of the object through a
+    BytesFeedParser; close() abandons the download for rejected mail.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._head = self._read_header_block()
+        self.headers = BytesParser(policy=policy.default).parsebytes(
+            self._head, headersonly=True
+        )
+
+    @classmethod
+    def open(cls, bucket: str, key: str) -> 'IncomingEmail':
+        """Start reading an email from S3"""
+        return cls(storage.open_blob(key, bucket=bucket))
+
+    def _read_header_block(self) -> bytes:
+        head = b''
+        while len(head) < MAX_HEADER_SIZE:
+            chunk = self.stream.read(EMAIL_READ_SIZE)
+            if not chunk:
+                break
+            head += chunk
+            if b'\n\n' in head or b'\r\n\r\n' in head:
+                break
+        return head
+
+    @property
+    def recipients(self) -> List[str]:
+        """All To and Cc header values (Bcc recipients only appear in the envelope)"""
+        return (self.headers.get_all('To') or []) + (self.headers.get_all('Cc') or [])
+
+    def parse(self) -> dict:
+        """Download and parse the body"""
+        # compat32 builds plain Message objects, much cheaper than the
+        # EmailMessage policy; headers were already decoded above. The whole
+        # encoded message is held in the resulting tree.
+        parser = BytesFeedParser(policy=policy.compat32)
+        try:
+            parser.feed(self._head)
+            self._head = b''
+            for chunk in iter(lambda: self.stream.read(EMAIL_READ_SIZE), b''):
+                parser.feed(chunk)
+        finally:
+            self.close()
+        return extract_email_data(self.headers, parser.close())
+
+    def close(self) -> None:
+        try:
+            self.stream.close()
+        except Exception:
+            pass
+
+
+def _decode_text_part(part) -> str:
+    """Decode a text part's payload using its declared charset"""
+    payload = part.get_payload(decode=True) or b''
+    charset = part.get_content_charset() or 'us-ascii'
+    try:
+        return payload.decode(charset, errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+
+def _decode_filename(part) -> Optional[str]:
+    """Attachment filename with RFC 2047 encoded-words decoded"""
+    filename = part.get_filename()
+    if filename and '=?' in filename:
+        try:
+            filename = str(make_header(decode_header(filename)))
+        except Exception:
+            pass
+    return filename[:MAX_HEADER_FIELD_CHARS] if filename else filename
+
+
+def extract_email_data(headers, msg) -> dict:
+    """Extract fields, bodies and attachments from a parsed message"""
     # Extract fields
-    to_address = msg.get('To', '')
-    from_address = msg.get('From', '')
-    subject = msg.get('Subject', '(No Subject)')
+    to_address = headers.get('To', '')
+    from_address = str(headers.get('From', ''))[:MAX_HEADER_FIELD_CHARS]
+    subject = str(headers.get('Subject', '(No Subject)'))[:MAX_HEADER_FIELD_CHARS]
     
     # Extract body and attachments
     text_body = ""
@@ -129,172 +522,366 @@ def parse_email_from_s3(bucket: str, key: str) -> dict:
             
             # Check if this is an attachment
             if content_disposition == 'attachment' or (content_disposition == 'inline' and part.get_filename()):
-                filename = part.get_filename()
+                filename = _decode_filename(part)
                 if filename:
                     try:
-                        payload = part.get_payload(decode=True)
-                        if payload:
+                        # Keep the part; it is decoded while uploading
+                        payload = part.get_payload()
+                        if payload and (not isinstance(payload, str) or payload.strip()):
                             attachments.append({
                                 'filename': filename,
                                 'content_type': content_type,
-                                'size': len(payload),
-                                'data': payload
+                                'part': part
                             })
                     except Exception as e:
                         print(f"Error extracting attachment {filename}: {e}")
             elif content_type == 'text/plain' and not text_body:
                 try:
-                    text_body = part.get_content()
+                    text_body = _decode_text_part(part)
                 except:
                     text_body = ""
             elif content_type == 'text/html' and not html_body:
                 try:
-                    html_body = part.get_content()
+                    html_body = _decode_text_part(part)
                 except:
                     html_body = ""
     else:
         content_type = msg.get_content_type()
         if content_type == 'text/plain':
-            text_body = msg.get_content()
+            text_body = _decode_text_part(msg)
         elif content_type == 'text/html':
-            html_body = msg.get_content()
+            html_body = _decode_text_part(msg)
     
-    # Sanitize HTML
-    if html_body:
+    # Sanitize HTML; HTML-only mail also gets a text body rendered from the
+    # same parse, so readers never have to convert it
+    if html_body and not text_body:
+        html_body, text_body = sanitize_html_with_text(html_body)
+    elif html_body:
         html_body = sanitize_html(html_body)
     
     return {
-        'to': to_address,
-        'from': from_address,
-        'subject': subject,
+        'to': str(to_address),
+        'from': str(from_address),
+        'subject': str(subject),
         'text_body': text_body or "",
         'html_body': html_body or "",
         'attachments': attachments
     }
 
 
-def store_email_in_dynamodb(inbox_id: str, email_data: dict):
-    """Store parsed email in DynamoDB and attachments in S3"""
+def upload_attachment(attachment: dict, expires_at: int) -> AttachmentInfo:
+    """
+    Store one attachment in S3 under the SHA-256 of its content
+
+    The payload is decoded chunk by chunk twice: once to hash it, and again
+    to stream it to S3 only if no usable copy is stored yet. A copy is
+    reused when it will outlive expires_at (the referencing inbox's expiry),
+    so a repeat attachment costs a single metadata write.
+    """
     import uuid
     
-    email_id = str(uuid.uuid4())
-    received_at = int(time.time())
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter_attachment_chunks(attachment['part']):
+        digest.update(chunk)
+        size += len(chunk)
+    digest = digest.hexdigest()
+    s3_key = attachment_blob_key(digest)
     
-    # Check body sizes
-    text_body = email_data['text_body']
-    html_body = email_data['html_body']
-    large_body_url = None
+    now = int(time.time())
+    if storage.reference_attachment_blob(digest, expires_at, expires_at - ATTACHMENT_BLOB_RETENTION_SECONDS):
+        print(f"Reusing attachment {attachment['filename']} at s3://{S3_BUCKET}/{s3_key}")
+    else:
+        # Upload to S3 (multipart for large attachments)
+        storage.put_blob_stream(
+            s3_key,
+            iter_attachment_chunks(attachment['part']),
+            attachment['content_type'],
+            metadata={'sha256': digest}
+        )
+        storage.mark_attachment_blob_uploaded(digest, now)
+        print(f"Saved attachment {attachment['filename']} to s3://{S3_BUCKET}/{s3_key}")
+    
+    # Metadata only (no binary data)
+    return AttachmentInfo(
+        id=str(uuid.uuid4()),
+        filename=attachment['filename'],
+        content_type=attachment['content_type'],
+        size=size,
+        s3_key=s3_key
+    )
+
+
+def prepare_emails(inbox_ids: List[str], email_data: dict) -> List[Email]:
+    """
+    Claim a slot in each inbox, upload attachments to S3 and build the Emails
+
+    One parsed message becomes one Email per recipient inbox. Offloaded
+    bodies and attachments are uploaded once and referenced by every copy;
+    attachments already stored by an earlier email are not uploaded at all.
+    Returns the Emails, not yet written; inboxes that are full or expired
+    are left out. Once a row is written, record it with deliver_email.
+    """
+    now = time.time()
+    received_at = int(now)
+    
+    # Claim a slot against each inbox's limit. This leaves the email_count
+    # and last_received_at that readers see alone until the row is written.
+    reserved = []
+    try:
+        for inbox_id in inbox_ids:
+            if storage.reserve_email_slot(inbox_id, MAX_EMAILS_PER_INBOX, received_at) is None:
+                print(f"Inbox {inbox_id} has reached maximum email limit ({MAX_EMAILS_PER_INBOX})")
+                continue
+            reserved.append(inbox_id)
+        if not reserved:
+            return []
+        
+        # The offloaded bodies are keyed under the first recipient's email
+        inbox_id = reserved[0]
+        email_id = generate_email_id(int(now * 1000))
+        email = Email(
+            inbox_id=inbox_id,
+            email_id=email_id,
+            from_address=email_data['from'],
+            subject=email_data['subject'],
+            text_body=email_data['text_body'],
+            html_body=email_data['html_body'],
+            received_at=received_at
+        )
+        
+        # Process attachments - upload to S3 concurrently and collect metadata
+        attachments = email_data.get('attachments', [])
+        uploads = [
+            upload_pool.submit(upload_attachment, attachment, received_at + MAX_TTL)
+            for attachment in attachments
+        ]
+        attachment_metadata = []
+        for attachment, upload in zip(attachments, uploads):
+            try:
+                attachment_metadata.append(upload.result())
+            except Exception as e:
+                print(f"Error saving attachment {attachment.get('filename', 'unknown')}: {e}")
+        email.attachments = attachment_metadata
+        
+        # Bodies too large to keep in the item go to S3 alongside the
+        # attachments; the item then only references them. Checked once the
+        # attachments are known, as the stored detail response lists them.
+        if email.inline_body_size() > BODY_INLINE_MAX_BYTES:
+            email.large_body_url = large_body_key(inbox_id, email_id)
+            storage.put_blob(
+                email.large_body_url,
+                pack_bodies(*email.encoded_bodies()),
+                'application/octet-stream'
+            )
+    except Exception:
+        for inbox_id in reserved:
+            release_slot(inbox_id)
+        raise
     
-    # If bodies are too large, truncate and add note
-    if len(text_body) > MAX_TEXT_BODY_SIZE:
-        text_body = text_body[:MAX_TEXT_BODY_SIZE] + "\n\n[Content truncated - too large]"
+    # The other recipients' rows share the encoded bodies and S3 objects
+    prepared = [email]
+    for inbox_id in reserved[1:]:
+        prepared.append(email.copy_for(inbox_id, generate_email_id(int(now * 1000))))
+    return prepared
+
+
+def release_slot(inbox_id: str) -> None:
+    """
+    Give back a slot claimed for an email that was not stored
+
+    A failure only leaves the inbox one slot short, so it is logged rather
+    than raised over the error being handled or the rest of the batch.
+    """
+    try:
+        storage.release_email_slot(inbox_id)
+    except Exception as e:
+        print(f"Error releasing email slot of inbox {inbox_id}: {e}")
+
+
+def deliver_email(email: Email) -> None:
+    """
+    Count a written email against its inbox and wake long-poll requests
+
+    Only called once the row is readable, so a client that sees the new
+    email_count (or list ETag) is guaranteed to find the email.
+    """
+    email_count = storage.record_email_delivered(email.inbox_id, email.received_at)
+    notification_hub.publish(email.inbox_id, email_count)
+    print(f"Stored email {email.email_id} for inbox {email.inbox_id}")
+
+
+def parse_and_prepare_emails(inbox_ids: List[str], message: IncomingEmail) -> List[Email]:
+    """Parse an email's body once and prepare it for every recipient (see prepare_emails)"""
+    return prepare_emails(inbox_ids, message.parse())
+
+
+def extract_s3_objects(event) -> List[Tuple[str, str, str, Optional[List[str]]]]:
+    """
+    List the emails referenced by an event as (item_id, bucket, key, recipients)
+
+    Handles S3 event notifications, SQS messages wrapping them, and SES
+    receipt-rule Lambda invocations (after an S3 action). item_id is what
+    gets reported back in batchItemFailures: the SQS messageId, or the
+    object key otherwise. recipients are the SES envelope recipients, or
+    None when only the stored message is available.
+    """
+    objects = []
+    for record in event.get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            body = json.loads(record['body'])
+            # s3:TestEvent messages carry no Records
+            for s3_record in body.get('Records', []):
+                objects.append((
+                    record['messageId'],
+                    s3_record['s3']['bucket']['name'],
+                    unquote_plus(s3_record['s3']['object']['key']),
+                    None
+                ))
+        elif record.get('eventSource') == 'aws:ses':
+            key = SES_OBJECT_KEY_PREFIX + record['ses']['mail']['messageId']
+            objects.append((key, S3_BUCKET, key, record['ses']['receipt']['recipients']))
+        else:
+            key = unquote_plus(record['s3']['object']['key'])
+            objects.append((key, record['s3']['bucket']['name'], key, None))
+    return objects
+
+
+def process_batch(objects: List[Tuple[str, str, str, Optional[List[str]]]]) -> List[str]:
+    """
+    Fetch, parse and store a batch of emails
+
+    S3 reads and parsing run concurrently, inbox lookups for the whole batch
+    are deduplicated into one batched read, and the emails are written with
+    one batched write. An email addressed to several inboxes is parsed once
+    and gets a row in each live one. Returns the item_ids of records that failed and
+    should be retried; rejected mail (unknown/expired/full inbox) is not a
+    failure.
+    """
+    failures = set()
     
-    if len(html_body) > MAX_HTML_BODY_SIZE:
-        html_body = html_body[:MAX_HTML_BODY_SIZE] + "\n\n<!-- Content truncated - too large -->"
+    # Reloads in the background; lookups cover inboxes not yet in it
+    if recipient_filter:
+        recipient_filter.maybe_refresh()
     
-    # Process attachments - save to S3 and collect metadata
-    attachment_metadata = []
-    attachments = email_data.get('attachments', [])
+    # With envelope recipients known, drop mail that cannot reach a live
+    # inbox before touching S3 at all
+    accepted = []
+    for item_id, bucket, key, recipients in objects:
+        if recipients is not None and not get_live_inbox_ids(extract_recipient_inbox_ids(recipients)):
+            print(f"No live inbox among recipients of {key}")
+            continue
+        accepted.append((item_id, bucket, key, recipients))
     
-    for idx, attachment in enumerate(attachments):
+    with ThreadPoolExecutor(max_workers=PARSER_WORKERS) as pool:
+        # Read just the headers of every email concurrently
+        open_futures = [
+            (item_id, key, recipients, pool.submit(IncomingEmail.open, bucket, key))
+            for item_id, bucket, key, recipients in accepted
+        ]
+        incoming = []
+        for item_id, key, recipients, future in open_futures:
+            try:
+                message = future.result()
+            except Exception as e:
+                print(f"Error reading email {key}: {e}")
+                failures.add(item_id)
+                continue
+            # The envelope also covers Bcc recipients; without it fall back
+            # to the To/Cc headers
+            inbox_ids = extract_recipient_inbox_ids(
+                recipients if recipients is not None else message.recipients
+            )
+            print(f"Inbox IDs for {key}: {inbox_ids}")
+            incoming.append((item_id, inbox_ids, message))
+        
+        # Check all recipient inboxes with one batched lookup
         try:
-            # Generate S3 key for attachment
-            attachment_id = str(uuid.uuid4())
-            s3_key = f"attachments/{inbox_id}/{email_id}/{attachment_id}/{attachment['filename']}"
-            
-            # Upload to S3
-            s3.put_object(
-                Bucket=S3_BUCKET,
-                Key=s3_key,
-                Body=attachment['data'],
-                ContentType=attachment['content_type'],
-                Metadata={
-                    'inbox_id': inbox_id,
-                    'email_id': email_id,
-                    'original_filename': attachment['filename']
-                }
+            live_inboxes = get_live_inbox_ids(
+                inbox_id for _, inbox_ids, _ in incoming for inbox_id in inbox_ids
             )
-            
-            # Store metadata (no binary data)
-            attachment_metadata.append({
-                'M': {
-                    'id': {'S': attachment_id},
-                    'filename': {'S': attachment['filename']},
-                    'content_type': {'S': attachment['content_type']},
-                    'size': {'N': str(attachment['size'])},
-                    's3_key': {'S': s3_key}
-                }
-            })
-            
-            print(f"Saved attachment {attachment['filename']} to s3://{S3_BUCKET}/{s3_key}")
         except Exception as e:
-            print(f"Error saving attachment {attachment.get('filename', 'unknown')}: {e}")
-    
-    # Store in DynamoDB
-    item = {
-        'inbox_id': {'S': inbox_id},
-        'email_id': {'S': email_id},
-        'from': {'S': email_data['from']},
-        'subject': {'S': email_data['subject']},
-        'text_body': {'S': text_body},
-        'html_body': {'S': html_body},
-        'received_at': {'N': str(received_at)}
-    }
+            print(f"Error checking inboxes: {e}")
+            for item_id, _, message in incoming:
+                message.close()
+                failures.add(item_id)
+            return sorted(failures)
+        
+        # Download and parse each body once if any recipient is live, then
+        # claim slots and upload attachments, all concurrently
+        prepare_futures = []
+        for item_id, inbox_ids, message in incoming:
+            targets = [inbox_id for inbox_id in inbox_ids if inbox_id in live_inboxes]
+            if not targets:
+                print(f"No live inbox among {inbox_ids}")
+                message.close()
+                continue
+            prepare_futures.append(
+                (item_id, targets, pool.submit(parse_and_prepare_emails, targets, message))
+            )
+        prepared = []
+        for item_id, targets, future in prepare_futures:
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error storing email for inboxes {targets}: {e}")
+                failures.add(item_id)
+                continue
+            prepared.extend((item_id, email) for email in results)
     
-    # Add attachments metadata if present
-    if attachment_metadata:
-        item['attachments'] = {'L': attachment_metadata}
+    if not prepared:
+        return sorted(failures)
     
-    if large_body_url:
-        item['large_body_url'] = {'S': large_body_url}
+    # Write the rows of every recipient of every email with one batched write
+    try:
+        unwritten = set(storage.put_emails([email for _, email in prepared]))
+    except Exception as e:
+        print(f"Error writing emails: {e}")
+        unwritten = {email.email_id for _, email in prepared}
     
-    dynamodb.put_item(TableName=EMAILS_TABLE, Item=item)
+    # A record with any unwritten row is retried as a whole, so recipients
+    # already written may receive it twice; that beats losing it
+    for item_id, email in prepared:
+        if email.email_id in unwritten:
+            release_slot(email.inbox_id)
+            failures.add(item_id)
+            continue
+        # An uncounted row would stay hidden behind the list ETag, so a
+        # failure to count it retries the record like a failed write
+        try:
+            deliver_email(email)
+        except Exception as e:
+            print(f"Error recording delivery of {email.email_id} to inbox {email.inbox_id}: {e}")
+            failures.add(item_id)
     
-    print(f"Stored email {email_id} for inbox {inbox_id}")
+    return sorted(failures)
 
 
 def lambda_handler(event, context):
     """
     Lambda handler for SES email processing
     
-    Triggered by S3 event when SES stores email
+    Triggered by S3 event when SES stores email, either directly or through
+    an SQS queue. Records are processed as one batch; with SQS, failed
+    records are reported in batchItemFailures (enable
+    ReportBatchItemFailures on the event source mapping) so only they are
+    retried.
     """
     print(f"Received event: {json.dumps(event)}")
     
     try:
-        # Parse S3 event
-        for record in event['Records']:
-            bucket = record['s3']['bucket']['name']
-            key = record['s3']['object']['key']
-            
-            print(f"Processing email from s3://{bucket}/{key}")
-            
-            # Parse email
-            email_data = parse_email_from_s3(bucket, key)
-            
-            # Extract inbox ID
-            inbox_id = extract_inbox_id_from_email(email_data['to'])
-            print(f"Inbox ID: {inbox_id}")
-            
-            # Check if inbox exists and not expired
-            if not check_inbox_exists(inbox_id):
-                print(f"Inbox {inbox_id} does not exist or has expired")
-                continue
-            
-            # Check email limit
-            email_count = count_emails_in_inbox(inbox_id)
-            if email_count >= MAX_EMAILS_PER_INBOX:
-                print(f"Inbox {inbox_id} has reached maximum email limit ({MAX_EMAILS_PER_INBOX})")
-                continue
-            
-            # Store email
-            store_email_in_dynamodb(inbox_id, email_data)
-            
-            print(f"Successfully processed email for inbox {inbox_id}")
+        objects = extract_s3_objects(event)
+        print(f"Processing {len(objects)} email(s)")
+        
+        failures = process_batch(objects)
+        
+        print(f"Inbox cache: {inbox_cache.stats()}")
+        print(f"Sanitizer cache: {html_sanitizer.stats()}")
         
         return {
             'statusCode': 200,
-            'body': json.dumps('Email processed successfully')
+            'body': json.dumps(f'Processed {len(objects) - len(failures)} of {len(objects)} email(s)'),
+            'batchItemFailures': [{'itemIdentifier': item_id} for item_id in failures]
         }
     
     except Exception as e:
@@ -302,7 +889,12 @@ def lambda_handler(event, context):
         import traceback
         traceback.print_exc()
         
+        # Retry every SQS message rather than letting them be deleted
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': json.dumps(f'Error: {str(e)}'),
+            'batchItemFailures': [
+                {'itemIdentifier': record['messageId']}
+                for record in event.get('Records', []) if 'messageId' in record
+            ]
         }
@@ -1,9 +1,192 @@
 """
 DynamoDB models for email management
 """
-import uuid
-from typing import Optional, List
-from pydantic import BaseModel
+import gzip
+import json
+import os
+import re
+import struct
+import threading
+import time
+import unicodedata
+import zlib
+from email.header import decode_header, make_header
+from email.utils import parseaddr
+from typing import ClassVar, Optional, List, Tuple
+from pydantic import BaseModel, PrivateAttr
+
+# Crockford base32, the ULID alphabet; its ASCII order matches numeric order
+ID_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ID_TIME_CHARS = 10    # 48-bit millisecond timestamp
+ID_RANDOM_CHARS = 16  # 80 random bits
+ID_LENGTH = ID_TIME_CHARS + ID_RANDOM_CHARS
+
+_id_lock = threading.Lock()
+_last_id_time = -1
+_last_id_random = 0
+
+
+def _encode_base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(ID_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def generate_email_id(timestamp_ms: Optional[int] = None) -> str:
+    """
+    Generate a time-ordered email ID (ULID format)
+
+    IDs sort lexicographically by creation time, so the emails table's sort
+    key follows receipt order. IDs generated in the same millisecond by this
+    process increment the random part, keeping them strictly increasing.
+    """
+    global _last_id_time, _last_id_random
+    if timestamp_ms is None:
+        timestamp_ms = int(time.time() * 1000)
+    with _id_lock:
+        if timestamp_ms <= _last_id_time:
+            timestamp_ms = _last_id_time
+            random_part = _last_id_random + 1
+        else:
+            random_part = int.from_bytes(os.urandom(10), 'big')
+        _last_id_time, _last_id_random = timestamp_ms, random_part
+    return _encode_base32(timestamp_ms, ID_TIME_CHARS) + _encode_base32(random_part, ID_RANDOM_CHARS)
+
+
+def email_id_bound(timestamp_ms: int, upper: bool = False) -> str:
+    """Smallest (or with upper=True, largest) email ID for a millisecond"""
+    fill = ID_ALPHABET[-1] if upper else ID_ALPHABET[0]
+    return _encode_base32(timestamp_ms, ID_TIME_CHARS) + fill * ID_RANDOM_CHARS
+
+
+def email_id_timestamp(email_id: str) -> int:
+    """Millisecond timestamp of a time-ordered email ID"""
+    value = 0
+    for char in email_id[:ID_TIME_CHARS]:
+        value = (value << 5) | ID_ALPHABET.index(char)
+    return value
+
+
+def is_time_ordered_id(email_id: str) -> bool:
+    """True for IDs from generate_email_id, False for legacy UUID4 IDs"""
+    return len(email_id) == ID_LENGTH and all(c in ID_ALPHABET for c in email_id)
+
+
+# Emails are stored with their detail response pre-serialized as gzip JSON in
+# a `detail` binary attribute behind a version byte (DETAIL_GZIP), which
+# get_email serves as-is. When the stored bodies of an email exceed
+# BODY_INLINE_MAX_BYTES they go to S3 instead (see pack_bodies), each as a
+# version byte followed by the payload: BODY_RAW (UTF-8, for bodies too small
+# to gain from compression) or BODY_ZLIB. The item then only keeps the object
+# key, keeping items well under DynamoDB's 400KB limit and list/detail reads
+# cheap. Items from before either format keep plain string bodies.
+BODY_RAW = 0x00
+BODY_ZLIB = 0x01
+DETAIL_GZIP = 0x01
+BODY_INLINE_MAX_BYTES = int(os.getenv('BODY_INLINE_MAX_BYTES', str(64 * 1024)))
+BODY_COMPRESSION_LEVEL = int(os.getenv('BODY_COMPRESSION_LEVEL', '6'))
+# Bodies shorter than this are stored raw without trying to compress them
+BODY_COMPRESS_MIN_BYTES = 64
+
+
+def encode_body(body: str) -> bytes:
+    """Encode a text or HTML body for storage"""
+    data = body.encode('utf-8')
+    if len(data) >= BODY_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data, BODY_COMPRESSION_LEVEL)
+        if len(compressed) < len(data):
+            return bytes((BODY_ZLIB,)) + compressed
+    return bytes((BODY_RAW,)) + data
+
+
+def decode_body(attribute: Optional[dict]) -> str:
+    """Read a body: encoded binary (see encode_body), or a legacy plain string"""
+    if not attribute:
+        return ""
+    if 'S' in attribute:
+        return attribute['S']
+    
+    data = attribute['B']
+    if not data:
+        return ""
+    version = data[0]
+    if version == BODY_RAW:
+        return data[1:].decode('utf-8')
+    if version == BODY_ZLIB:
+        return zlib.decompress(data[1:]).decode('utf-8')
+    raise ValueError(f"Unknown body encoding version {version}")
+
+
+def encode_detail(response: dict) -> bytes:
+    """Serialize and gzip a detail response, byte-for-byte as JSONResponse would render it"""
+    data = json.dumps(response, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return bytes((DETAIL_GZIP,)) + gzip.compress(data, BODY_COMPRESSION_LEVEL, mtime=0)
+
+
+def detail_gzip(data: bytes) -> bytes:
+    """The gzip JSON stream of a stored detail attribute, as served to clients"""
+    version = data[0]
+    if version == DETAIL_GZIP:
+        return data[1:]
+    raise ValueError(f"Unknown detail encoding version {version}")
+
+
+def decode_detail(data: bytes) -> dict:
+    """Read a detail attribute written by encode_detail"""
+    return json.loads(gzip.decompress(detail_gzip(data)))
+
+
+def large_body_key(inbox_id: str, email_id: str) -> str:
+    """S3 key of an email's offloaded bodies"""
+    return f"bodies/{inbox_id}/{email_id}"
+
+
+def attachment_blob_key(digest: str) -> str:
+    """S3 key of an attachment stored by the hex SHA-256 of its content"""
+    return f"attachments/sha256/{digest}"
+
+
+# Characters of body text shown in list previews
+SNIPPET_LENGTH = 160
+_WHITESPACE = re.compile(r'\s+')
+
+
+def make_snippet(text: str, length: int = SNIPPET_LENGTH) -> str:
+    """The start of a body as one line of at most `length` characters"""
+    # Only the start is needed; leave room for whitespace that collapses
+    snippet = _WHITESPACE.sub(' ', text[:length * 4]).strip()
+    if len(snippet) > length:
+        snippet = snippet[:length - 1].rstrip() + '\u2026'
+    return snippet
+
+
+def from_display_name(from_address: str) -> str:
+    """Decoded, whitespace-normalized display name of a From header, or ''"""
+    name = parseaddr(from_address)[0]
+    if '=?' in name:
+        # RFC 2047 words left encoded, e.g. by a compat32 parse
+        try:
+            name = str(make_header(decode_header(name)))
+        except Exception:
+            pass
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', name)).strip()
+
+
+def pack_bodies(text_body: bytes, html_body: bytes) -> bytes:
+    """Join encoded text and HTML bodies into one S3 object"""
+    return struct.pack('>I', len(text_body)) + text_body + html_body
+
+
+def unpack_bodies(data: bytes) -> Tuple[str, str]:
+    """Split an S3 body object back into (text_body, html_body)"""
+    (text_length,) = struct.unpack_from('>I', data)
+    text_end = 4 + text_length
+    return (
+        decode_body({'B': data[4:text_end]}),
+        decode_body({'B': data[text_end:]})
+    )
 
 
 class AttachmentInfo(BaseModel):
@@ -27,6 +210,11 @@ class Email(BaseModel):
     large_body_url: Optional[str] = None
     attachments: List[AttachmentInfo] = []
     
+    # (text, html) encoded once and reused by to_dynamodb_item
+    _encoded_bodies: Optional[Tuple[bytes, bytes]] = PrivateAttr(default=None)
+    # Pre-serialized detail response, see encode_detail
+    _detail: Optional[bytes] = PrivateAttr(default=None)
+    
     @classmethod
     def create(cls, inbox_id: str, from_address: str, subject: str, 
                text_body: str, html_body: str, received_at: int,
@@ -35,7 +223,7 @@ class Email(BaseModel):
         """Create a new email"""
         return cls(
             inbox_id=inbox_id,
-            email_id=str(uuid.uuid4()),
+            email_id=generate_email_id(),
             from_address=from_address,
             subject=subject,
             text_body=text_body,
@@ -45,6 +233,45 @@ class Email(BaseModel):
             attachments=attachments or []
         )
     
+    def encoded_bodies(self) -> Tuple[bytes, bytes]:
+        """The encoded (text_body, html_body), see encode_body"""
+        if self._encoded_bodies is None:
+            self._encoded_bodies = (encode_body(self.text_body), encode_body(self.html_body))
+        return self._encoded_bodies
+    
+    def detail_response(self) -> dict:
+        """EmailDetailResponse as a JSON-ready dict, as get_email returns it"""
+        return {
+            'email_id': self.email_id,
+            'from_address': self.from_address,
+            'subject': self.subject,
+            'text_body': self.text_body,
+            'html_body': self.html_body,
+            'received_at': self.received_at,
+            'large_body_url': None,
+            'attachments': [
+                {'id': a.id, 'filename': a.filename, 'content_type': a.content_type, 'size': a.size}
+                for a in self.attachments
+            ]
+        }
+    
+    def detail_payload(self) -> bytes:
+        """The detail response as stored in the item (see encode_detail)"""
+        if self._detail is None:
+            self._detail = encode_detail(self.detail_response())
+        return self._detail
+    
+    def inline_body_size(self) -> int:
+        """Bytes the bodies would take if stored in the item"""
+        return len(self.detail_payload())
+    
+    def copy_for(self, inbox_id: str, email_id: str) -> 'Email':
+        """The same email delivered to another inbox, sharing the encoded bodies"""
+        copy = self.model_copy(update={'inbox_id': inbox_id, 'email_id': email_id})
+        # The detail response embeds email_id
+        copy._detail = None
+        return copy
+    
     def to_dynamodb_item(self) -> dict:
         """Convert to DynamoDB item format"""
         item = {
@@ -52,12 +279,25 @@ class Email(BaseModel):
             'email_id': {'S': self.email_id},
             'from': {'S': self.from_address},
             'subject': {'S': self.subject},
-            'text_body': {'S': self.text_body},
-            'html_body': {'S': self.html_body},
-            'received_at': {'N': str(self.received_at)}
+            'received_at': {'N': str(self.received_at)},
+            # Summary attributes so list pages can skip the bodies
+            'has_html': {'BOOL': bool(self.html_body)},
+            'attachment_count': {'N': str(len(self.attachments))},
+            'attachment_size': {'N': str(sum(a.size for a in self.attachments))},
+            'text_size': {'N': str(len(self.text_body.encode('utf-8')))},
+            'html_size': {'N': str(len(self.html_body.encode('utf-8')))}
         }
+        snippet = make_snippet(self.text_body)
+        if snippet:
+            item['snippet'] = {'S': snippet}
+        from_name = from_display_name(self.from_address)
+        if from_name:
+            item['from_name'] = {'S': from_name}
         if self.large_body_url:
+            # Bodies live in S3; see large_body_key
             item['large_body_url'] = {'S': self.large_body_url}
+        else:
+            item['detail'] = {'B': self.detail_payload()}
         if self.attachments:
             item['attachments'] = {'L': [
                 {'M': {
@@ -72,7 +312,13 @@ class Email(BaseModel):
     
     @classmethod
     def from_dynamodb_item(cls, item: dict) -> 'Email':
-        """Create Email from DynamoDB item"""
+        """
+        Create Email from DynamoDB item
+
+        For offloaded emails (large_body_url set) the bodies are empty; read
+        them with unpack_bodies from the object at large_body_url.
+        """
+        record = EmailRecord(item)
         attachments = []
         if 'attachments' in item:
             for att in item['attachments']['L']:
@@ -90,8 +336,8 @@ class Email(BaseModel):
             email_id=item['email_id']['S'],
             from_address=item['from']['S'],
             subject=item['subject']['S'],
-            text_body=item['text_body']['S'],
-            html_body=item['html_body']['S'],
+            text_body=record.text_body,
+            html_body=record.html_body,
             received_at=int(item['received_at']['N']),
             large_body_url=item.get('large_body_url', {}).get('S'),
             attachments=attachments
@@ -114,6 +360,37 @@ class EmailListItem(BaseModel):
     received_at: int
     has_html: bool
     attachment_count: int = 0
+    attachment_size: int = 0
+    text_size: int = 0
+    html_size: int = 0
+    snippet: str = ''
+    from_name: str = ''
+
+    # Attributes fetched for list pages; bodies and attachment metadata are
+    # deliberately left out. `from` is a DynamoDB reserved word.
+    PROJECTION_EXPRESSION: ClassVar[str] = (
+        'email_id, #from, subject, received_at, has_html, attachment_count, '
+        'attachment_size, text_size, html_size, snippet, from_name'
+    )
+    PROJECTION_NAMES: ClassVar[dict] = {'#from': 'from'}
+
+    @classmethod
+    def from_dynamodb_item(cls, item: dict) -> 'EmailListItem':
+        """Create list item from a (projected) DynamoDB item"""
+        return cls(
+            email_id=item['email_id']['S'],
+            from_address=item['from']['S'],
+            subject=item['subject']['S'],
+            received_at=int(item['received_at']['N']),
+            # Items written before the summary attributes existed
+            has_html=item.get('has_html', {}).get('BOOL', False),
+            attachment_count=int(item.get('attachment_count', {}).get('N', '0')),
+            attachment_size=int(item.get('attachment_size', {}).get('N', '0')),
+            text_size=int(item.get('text_size', {}).get('N', '0')),
+            html_size=int(item.get('html_size', {}).get('N', '0')),
+            snippet=item.get('snippet', {}).get('S', ''),
+            from_name=item.get('from_name', {}).get('S', '')
+        )
 
 
 class EmailListResponse(BaseModel):
@@ -134,3 +411,154 @@ class EmailDetailResponse(BaseModel):
     large_body_url: Optional[str] = None
     attachments: List[AttachmentResponse] = []
 
+
+class EmailBatchRequest(BaseModel):
+    """Request model for fetching many emails of one inbox"""
+    email_ids: List[str]
+
+
+class EmailBatchResponse(BaseModel):
+    """Response model for a batch email fetch"""
+    emails: List[EmailDetailResponse]
+    count: int
+    # Requested IDs that do not exist in the inbox
+    missing: List[str] = []
+
+
+
+# Read-side records. The API's hot routes build these straight from DynamoDB
+# items and render them to JSON themselves; the pydantic models above stay the
+# documented response schema but are not instantiated per item.
+
+class AttachmentRecord:
+    """Attachment metadata read from an email item"""
+    __slots__ = ('id', 'filename', 'content_type', 'size', 's3_key')
+
+    def __init__(self, id: str, filename: str, content_type: str, size: int, s3_key: str):
+        self.id = id
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.s3_key = s3_key
+
+    @classmethod
+    def from_dynamodb_value(cls, value: dict) -> 'AttachmentRecord':
+        data = value['M']
+        return cls(
+            data['id']['S'],
+            data['filename']['S'],
+            data['content_type']['S'],
+            int(data['size']['N']),
+            data['s3_key']['S']
+        )
+
+    def to_response(self) -> dict:
+        """AttachmentResponse as a JSON-ready dict"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'size': self.size
+        }
+
+
+class EmailSummary:
+    """List-page fields of an email, read from a (projected) item"""
+    __slots__ = ('email_id', 'from_address', 'subject', 'received_at', 'has_html', 'attachment_count',
+                 'attachment_size', 'text_size', 'html_size', 'snippet', 'from_name')
+
+    def __init__(self, item: dict):
+        self.email_id = item['email_id']['S']
+        self.from_address = item['from']['S']
+        self.subject = item['subject']['S']
+        self.received_at = int(item['received_at']['N'])
+        # Items written before the summary attributes existed
+        self.has_html = item['has_html']['BOOL'] if 'has_html' in item else False
+        self.attachment_count = int(item['attachment_count']['N']) if 'attachment_count' in item else 0
+        self.attachment_size = int(item['attachment_size']['N']) if 'attachment_size' in item else 0
+        self.text_size = int(item['text_size']['N']) if 'text_size' in item else 0
+        self.html_size = int(item['html_size']['N']) if 'html_size' in item else 0
+        self.snippet = item['snippet']['S'] if 'snippet' in item else ''
+        self.from_name = item['from_name']['S'] if 'from_name' in item else ''
+
+    def to_response(self) -> dict:
+        """EmailListItem as a JSON-ready dict"""
+        return {
+            'email_id': self.email_id,
+            'from_address': self.from_address,
+            'subject': self.subject,
+            'received_at': self.received_at,
+            'has_html': self.has_html,
+            'attachment_count': self.attachment_count,
+            'attachment_size': self.attachment_size,
+            'text_size': self.text_size,
+            'html_size': self.html_size,
+            'snippet': self.snippet,
+            'from_name': self.from_name
+        }
+
+
+class EmailRecord:
+    """A full email read from an item, bodies decoded on access (see Email for writing)"""
+    __slots__ = ('inbox_id', 'email_id', 'from_address', 'subject', 'received_at', 'large_body_url',
+                 'attachments', 'detail', '_text_body', '_html_body')
+
+    def __init__(self, item: dict):
+        self.inbox_id = item['inbox_id']['S']
+        self.email_id = item['email_id']['S']
+        self.from_address = item['from']['S']
+        self.subject = item['subject']['S']
+        self.received_at = int(item['received_at']['N'])
+        self.large_body_url = item['large_body_url']['S'] if 'large_body_url' in item else None
+        self.attachments = [
+            AttachmentRecord.from_dynamodb_value(value) for value in item.get('attachments', {}).get('L', [])
+        ]
+        # The pre-serialized detail response (gzip JSON, version byte
+        # removed), or None for older and offloaded emails. Bodies are only
+        # decoded from it when read.
+        self.detail = detail_gzip(item['detail']['B']) if 'detail' in item else None
+        if self.detail is None:
+            # Empty for offloaded emails; see large_body_url and unpack_bodies
+            self._text_body = decode_body(item.get('text_body'))
+            self._html_body = decode_body(item.get('html_body'))
+        else:
+            self._text_body = self._html_body = None
+
+    def _decode_detail(self) -> None:
+        response = json.loads(gzip.decompress(self.detail))
+        self._text_body = response['text_body']
+        self._html_body = response['html_body']
+
+    @property
+    def text_body(self) -> str:
+        if self._text_body is None:
+            self._decode_detail()
+        return self._text_body
+
+    @property
+    def html_body(self) -> str:
+        if self._html_body is None:
+            self._decode_detail()
+        return self._html_body
+
+    def to_response(self, text_body: Optional[str] = None, html_body: Optional[str] = None) -> dict:
+        """EmailDetailResponse as a JSON-ready dict, optionally with resolved bodies"""
+        return {
+            'email_id': self.email_id,
+            'from_address': self.from_address,
+            'subject': self.subject,
+            'text_body': self.text_body if text_body is None else text_body,
+            'html_body': self.html_body if html_body is None else html_body,
+            'received_at': self.received_at,
+            'large_body_url': None,
+            'attachments': [attachment.to_response() for attachment in self.attachments]
+        }
+
+
+def email_list_response(emails: List[EmailSummary], last_key: Optional[str]) -> dict:
+    """EmailListResponse as a JSON-ready dict"""
+    return {
+        'emails': [email.to_response() for email in emails],
+        'count': len(emails),
+        'last_key': last_key
+    }
@@ -4,21 +4,72 @@ DynamoDB models for inbox management
 import time
 import secrets
 import string
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 
+INBOX_ID_ALPHABET = string.ascii_lowercase + string.digits
+INBOX_ID_LENGTH = 8
+INBOX_ID_SPACE = len(INBOX_ID_ALPHABET) ** INBOX_ID_LENGTH
+
+# Random bytes are mapped onto the alphabet with one bytes.translate call.
+# Bytes at or above the largest multiple of the alphabet size are deleted
+# (rejection sampling), so every character stays equally likely.
+_ID_ACCEPT = 256 - 256 % len(INBOX_ID_ALPHABET)
+_ID_TABLE = bytes(
+    ord(INBOX_ID_ALPHABET[b % len(INBOX_ID_ALPHABET)]) if b < _ID_ACCEPT else 0 for b in range(256)
+)
+_ID_REJECT = bytes(range(_ID_ACCEPT, 256))
+
+
+def generate_inbox_ids(count: int, length: int = INBOX_ID_LENGTH) -> List[str]:
+    """Generate `count` random inbox IDs from a single token_bytes draw"""
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        missing = needed - len(chars)
+        # About 1.6% of bytes are rejected; over-draw slightly so one
+        # draw is almost always enough
+        chars += secrets.token_bytes(missing + missing // 32 + 8).translate(_ID_TABLE, _ID_REJECT)
+    text = chars[:needed].decode('ascii')
+    return [text[i:i + length] for i in range(0, needed, length)]
+
+
+def inbox_id_collision_report(live_inboxes: int, attempts: int = 1) -> dict:
+    """
+    Collision odds for a new inbox ID given the number of live inboxes
+
+    - collision_probability: chance one generated ID is already taken
+    - failure_probability: chance all `attempts` conditional writes collide
+    - expected_writes: average conditional writes per created inbox
+    """
+    p = min(1.0, live_inboxes / INBOX_ID_SPACE)
+    return {
+        'live_inboxes': live_inboxes,
+        'collision_probability': p,
+        'failure_probability': p ** attempts,
+        'expected_writes': 1 / (1 - p) if p < 1 else float('inf')
+    }
+
 
 class Inbox(BaseModel):
     """Inbox model matching DynamoDB schema"""
     id: str
     created_at: int
     expires_at: int
+    # Maintained atomically by the email parser once each email is written
+    # (slots are claimed separately, in the item's reserved_count)
+    email_count: int = 0
+    last_received_at: Optional[int] = None
     
     @staticmethod
-    def generate_inbox_id(length: int = 8) -> str:
+    def generate_inbox_id(length: int = INBOX_ID_LENGTH) -> str:
         """Generate a random inbox ID (8-character alphanumeric lowercase)"""
-        alphabet = string.ascii_lowercase + string.digits
-        return ''.join(secrets.choice(alphabet) for _ in range(length))
+        return generate_inbox_ids(1, length)[0]
+    
+    @staticmethod
+    def is_valid_id(inbox_id: str) -> bool:
+        """Check whether a string could be a generated inbox ID"""
+        return len(inbox_id) == INBOX_ID_LENGTH and all(c in INBOX_ID_ALPHABET for c in inbox_id)
     
     @classmethod
     def create(cls, ttl_seconds: int = 3600) -> 'Inbox':
@@ -30,21 +81,37 @@ class Inbox(BaseModel):
             expires_at=now + ttl_seconds
         )
     
+    @classmethod
+    def create_many(cls, count: int, ttl_seconds: int = 3600) -> List['Inbox']:
+        """Create `count` new inboxes with the same TTL"""
+        now = int(time.time())
+        return [
+            cls(id=inbox_id, created_at=now, expires_at=now + ttl_seconds)
+            for inbox_id in generate_inbox_ids(count)
+        ]
+    
     def to_dynamodb_item(self) -> dict:
         """Convert to DynamoDB item format"""
-        return {
+        item = {
             'id': {'S': self.id},
             'created_at': {'N': str(self.created_at)},
-            'expires_at': {'N': str(self.expires_at)}
+            'expires_at': {'N': str(self.expires_at)},
+            'email_count': {'N': str(self.email_count)}
         }
+        if self.last_received_at is not None:
+            item['last_received_at'] = {'N': str(self.last_received_at)}
+        return item
     
     @classmethod
     def from_dynamodb_item(cls, item: dict) -> 'Inbox':
         """Create Inbox from DynamoDB item"""
+        last_received_at = item.get('last_received_at', {}).get('N')
         return cls(
             id=item['id']['S'],
             created_at=int(item['created_at']['N']),
-            expires_at=int(item['expires_at']['N'])
+            expires_at=int(item['expires_at']['N']),
+            email_count=int(item.get('email_count', {}).get('N', '0')),
+            last_received_at=int(last_received_at) if last_received_at is not None else None
         )
     
     def is_expired(self) -> bool:
@@ -68,6 +135,18 @@ class InboxCreateResponse(BaseModel):
     expires_at: int
 
 
+class InboxBatchCreateRequest(BaseModel):
+    """Request model for creating many inboxes at once"""
+    count: int
+    ttl: Optional[int] = 3600  # Default 1 hour
+
+
+class InboxBatchCreateResponse(BaseModel):
+    """Response model for batch inbox creation"""
+    inboxes: List[InboxCreateResponse]
+    count: int
+
+
 class InboxStatusResponse(BaseModel):
     """Response model for inbox status"""
     id: str
@@ -0,0 +1,64 @@
+"""
+Async wrappers that keep blocking boto3 calls off the event loop
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Maximum number of blocking storage calls in flight per worker process.
+# botocore's connection pool is sized to match so threads never queue on it.
+STORAGE_MAX_WORKERS = int(os.getenv('STORAGE_MAX_WORKERS', '128'))
+
+_executor = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Get the shared, bounded thread pool used for storage calls"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=STORAGE_MAX_WORKERS,
+            thread_name_prefix='storage'
+        )
+    return _executor
+
+
+def client_config():
+    """botocore config with a connection pool sized to the thread pool"""
+    from botocore.config import Config
+    return Config(max_pool_connections=STORAGE_MAX_WORKERS)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on the storage thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+class AsyncClient:
+    """
+    Awaitable facade over a blocking client
+
+    Wraps a boto3 client or a storage backend. Every method of the wrapped
+    client becomes a coroutine that runs the original call on the shared
+    storage thread pool, e.g. ``await storage.get_inbox(inbox_id)``.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return await run_blocking(method, *args, **kwargs)
+
+        call.__name__ = name
+        # Cache the wrapper so later lookups skip __getattr__
+        setattr(self, name, call)
+        return call
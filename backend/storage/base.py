@@ -0,0 +1,173 @@
+"""
+Storage backend interface shared by the API and the email parser
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.inbox import Inbox
+from models.email import Email, EmailRecord, EmailSummary
+
+
+class StorageBackend(ABC):
+    """
+    Persistence for inboxes, emails and attachment blobs
+
+    Implementations are synchronous; the API wraps them with
+    storage.aio.AsyncClient so calls run off the event loop.
+    """
+
+    # Inboxes
+
+    @abstractmethod
+    def get_inbox(self, inbox_id: str) -> Optional[Inbox]:
+        """Get an inbox by ID, or None if it does not exist"""
+
+    @abstractmethod
+    def get_inboxes(self, inbox_ids: Iterable[str]) -> Dict[str, Inbox]:
+        """Get many inboxes at once; IDs that do not exist are left out"""
+
+    @abstractmethod
+    def scan_live_inboxes(self, now: int) -> Iterator[Tuple[str, int]]:
+        """Yield (inbox_id, expires_at) for every inbox expiring after now"""
+
+    @abstractmethod
+    def put_inbox(self, inbox: Inbox) -> bool:
+        """
+        Store a new inbox
+
+        The write is conditional on the ID being unused: returns False,
+        leaving the existing inbox untouched, if it is already taken.
+        """
+
+    @abstractmethod
+    def put_inboxes(self, inboxes: List[Inbox]) -> List[str]:
+        """
+        Store many new inboxes at once
+
+        Batched writes cannot be conditional, so unlike put_inbox this
+        overwrites existing IDs; check for them with get_inboxes first.
+        Returns the IDs that could not be written after retries.
+        """
+
+    @abstractmethod
+    def reserve_email_slot(self, inbox_id: str, max_emails: int, received_at: int) -> Optional[int]:
+        """
+        Atomically claim room for one more email in an inbox
+
+        Increments the inbox's reserved_count, but only if the inbox exists,
+        has not expired and has fewer than max_emails slots claimed. Returns
+        the new reserved_count, or None (changing nothing) otherwise, so
+        concurrent deliveries can never push an inbox over the cap.
+        Readers never see reserved_count; see record_email_delivered.
+        """
+
+    @abstractmethod
+    def release_email_slot(self, inbox_id: str) -> None:
+        """Give back a slot claimed by reserve_email_slot (e.g. on a failed write)"""
+
+    @abstractmethod
+    def record_email_delivered(self, inbox_id: str, received_at: int) -> int:
+        """
+        Count an email whose item has been written
+
+        Increments email_count and sets last_received_at. The list ETag, the
+        status endpoint and long-poll watchers read these, so they only move
+        once the new email can actually be read. Returns the new email_count.
+        """
+
+    # Emails
+
+    @abstractmethod
+    def get_email(self, inbox_id: str, email_id: str) -> Optional[EmailRecord]:
+        """Get a single email, or None if it does not exist"""
+
+    @abstractmethod
+    def get_emails(self, inbox_id: str, email_ids: Iterable[str]) -> Dict[str, EmailRecord]:
+        """Get many emails of one inbox at once; IDs that do not exist are left out"""
+
+    @abstractmethod
+    def put_email(self, email: Email) -> None:
+        """Store an email"""
+
+    @abstractmethod
+    def put_emails(self, emails: List[Email]) -> List[str]:
+        """
+        Store many emails at once
+
+        Returns the email_ids that could not be written after retries; the
+        caller decides whether to retry them later.
+        """
+
+    @abstractmethod
+    def get_email_summary(self, inbox_id: str, email_id: str) -> Optional[EmailSummary]:
+        """Get the summary attributes of a single email, or None"""
+
+    @abstractmethod
+    def query_email_summaries(self, inbox_id: str, limit: int, last_key: Optional[str] = None,
+                              after_key: Optional[str] = None,
+                              min_received_at: Optional[int] = None
+                              ) -> Tuple[List[EmailSummary], Optional[str]]:
+        """
+        List email summaries in an inbox, newest first
+
+        Only the summary attributes are read, never the bodies. With
+        time-ordered email IDs, after_key restricts the query to a key range
+        of emails newer than that ID. min_received_at instead filters on
+        received_at (inclusive) and is only needed for legacy UUID4 cursors.
+        Returns the page and the key to pass as last_key to get the next page
+        (None when there are no more).
+        """
+
+    # Attachment and raw email blobs
+
+    @abstractmethod
+    def get_blob(self, key: str, bucket: Optional[str] = None) -> bytes:
+        """Read a blob; bucket defaults to the backend's own bucket"""
+
+    @abstractmethod
+    def open_blob(self, key: str, bucket: Optional[str] = None):
+        """Open a blob for incremental reading; returns a file-like object with read(n) and close()"""
+
+    @abstractmethod
+    def put_blob(self, key: str, data: bytes, content_type: str,
+                 metadata: Optional[dict] = None) -> None:
+        """Store a blob"""
+
+    @abstractmethod
+    def put_blob_stream(self, key: str, chunks: Iterator[bytes], content_type: str,
+                        metadata: Optional[dict] = None) -> int:
+        """
+        Store a blob from an iterator of chunks, returning its size
+
+        Implementations hold at most about one upload part in memory, so
+        large blobs never need to be materialized.
+        """
+
+    @abstractmethod
+    def blob_download_url(self, key: str, filename: str, expires_in: int = 3600,
+                          content_type: Optional[str] = None) -> str:
+        """
+        Get a time-limited URL that downloads the blob as an attachment
+
+        content_type overrides the stored one, for blobs shared by
+        attachments that were sent with different types.
+        """
+
+    # Content-addressed attachment references
+
+    @abstractmethod
+    def reference_attachment_blob(self, digest: str, expires_at: int, fresh_after: int) -> bool:
+        """
+        Record a reference to the attachment blob with this SHA-256
+
+        Raises the blob's expires_at to at least expires_at (the latest
+        expiry of any inbox referencing it); expiry alone decides how long
+        the blob is kept.
+        Returns True if the blob is stored and was uploaded after
+        fresh_after, so it can be reused as-is; otherwise the caller must
+        upload it and call mark_attachment_blob_uploaded.
+        """
+
+    @abstractmethod
+    def mark_attachment_blob_uploaded(self, digest: str, uploaded_at: int) -> None:
+        """Record that the attachment blob with this SHA-256 was (re)uploaded"""
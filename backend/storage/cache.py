@@ -0,0 +1,88 @@
+"""
+Bounded TTL/LRU cache of inbox records
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from models.inbox import Inbox
+
+# Configuration
+INBOX_CACHE_SIZE = int(os.getenv('INBOX_CACHE_SIZE', '10000'))
+INBOX_CACHE_TTL = int(os.getenv('INBOX_CACHE_TTL_SECONDS', '300'))
+INBOX_CACHE_NEGATIVE_TTL = int(os.getenv('INBOX_CACHE_NEGATIVE_TTL_SECONDS', '30'))
+
+_cache = None
+
+
+class InboxCache:
+    """
+    Cache of Inbox records for existence/expiry checks
+
+    Live inboxes are cached until the earlier of `ttl` seconds from now and
+    the inbox's own expires_at, so a cached entry never outlives its inbox.
+    Unknown and expired IDs are cached as negative entries for
+    `negative_ttl` seconds. The least recently used entry is evicted once
+    `max_entries` is reached.
+
+    Only the immutable fields (id, created_at, expires_at) of a cached inbox
+    are reliable; read the record from storage for email_count.
+    """
+
+    def __init__(self, max_entries: int = INBOX_CACHE_SIZE, ttl: int = INBOX_CACHE_TTL,
+                 negative_ttl: int = INBOX_CACHE_NEGATIVE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # inbox_id -> (cache_expires_at, inbox or None)
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[Inbox]]]' = OrderedDict()
+
+    def lookup(self, inbox_id: str) -> Tuple[bool, Optional[Inbox]]:
+        """
+        Look up an inbox without loading it
+
+        Returns (found, inbox). found is False on a cache miss; inbox is None
+        for a cached negative entry.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(inbox_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(inbox_id)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[inbox_id]
+            self.misses += 1
+            return False, None
+
+    def store(self, inbox_id: str, inbox: Optional[Inbox]) -> None:
+        """Cache a loaded inbox, or None for an unknown ID"""
+        now = time.time()
+        if inbox is None or inbox.expires_at <= now:
+            cache_expires_at = now + self.negative_ttl
+        else:
+            cache_expires_at = min(now + self.ttl, inbox.expires_at)
+        with self._lock:
+            self._entries[inbox_id] = (cache_expires_at, inbox)
+            self._entries.move_to_end(inbox_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def get_inbox_cache() -> InboxCache:
+    """Get the process-wide inbox cache shared by the API and the parser"""
+    global _cache
+    if _cache is None:
+        _cache = InboxCache()
+    return _cache
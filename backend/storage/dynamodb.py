@@ -0,0 +1,358 @@
+"""
+DynamoDB + S3 storage backend
+"""
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.inbox import Inbox
+from models.email import Email, EmailListItem, EmailRecord, EmailSummary
+from storage.base import StorageBackend
+
+# DynamoDB batch API limits
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+# Attempts for unprocessed batch keys/items, with exponential backoff
+BATCH_MAX_ATTEMPTS = 5
+BATCH_BACKOFF_SECONDS = 0.05
+# Streamed blobs larger than one part use S3 multipart upload (min part 5MB)
+MULTIPART_PART_SIZE = int(os.getenv('S3_MULTIPART_PART_SIZE', str(8 * 1024 * 1024)))
+
+
+class DynamoDBBackend(StorageBackend):
+    """Inboxes and emails in DynamoDB, blobs in S3"""
+
+    def __init__(self, dynamodb, s3, inboxes_table: str, emails_table: str, bucket: str,
+                 attachments_table: str = 'easytempinbox-attachments'):
+        self.dynamodb = dynamodb
+        self.s3 = s3
+        self.inboxes_table = inboxes_table
+        self.emails_table = emails_table
+        self.attachments_table = attachments_table
+        self.bucket = bucket
+
+    def get_inbox(self, inbox_id: str) -> Optional[Inbox]:
+        response = self.dynamodb.get_item(
+            TableName=self.inboxes_table,
+            Key={'id': {'S': inbox_id}}
+        )
+        if 'Item' not in response:
+            return None
+        return Inbox.from_dynamodb_item(response['Item'])
+
+    def get_inboxes(self, inbox_ids: Iterable[str]) -> Dict[str, Inbox]:
+        keys = [{'id': {'S': inbox_id}} for inbox_id in dict.fromkeys(inbox_ids)]
+        items = self._batch_get(self.inboxes_table, keys)
+        return {item['id']['S']: Inbox.from_dynamodb_item(item) for item in items}
+
+    def scan_live_inboxes(self, now: int) -> Iterator[Tuple[str, int]]:
+        paginator = self.dynamodb.get_paginator('scan')
+        pages = paginator.paginate(
+            TableName=self.inboxes_table,
+            ProjectionExpression='id, expires_at',
+            FilterExpression='expires_at > :now',
+            ExpressionAttributeValues={':now': {'N': str(now)}}
+        )
+        for page in pages:
+            for item in page.get('Items', []):
+                yield item['id']['S'], int(item['expires_at']['N'])
+
+    def put_inbox(self, inbox: Inbox) -> bool:
+        try:
+            self.dynamodb.put_item(
+                TableName=self.inboxes_table,
+                Item=inbox.to_dynamodb_item(),
+                ConditionExpression='attribute_not_exists(id)'
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def put_inboxes(self, inboxes: List[Inbox]) -> List[str]:
+        requests = [{'PutRequest': {'Item': inbox.to_dynamodb_item()}} for inbox in inboxes]
+        unprocessed = self._batch_write(self.inboxes_table, requests)
+        return [request['PutRequest']['Item']['id']['S'] for request in unprocessed]
+
+    def reserve_email_slot(self, inbox_id: str, max_emails: int, received_at: int) -> Optional[int]:
+        try:
+            response = self.dynamodb.update_item(
+                TableName=self.inboxes_table,
+                Key={'id': {'S': inbox_id}},
+                UpdateExpression='ADD reserved_count :one',
+                ConditionExpression=(
+                    'attribute_exists(id) AND expires_at > :now AND '
+                    '(attribute_not_exists(reserved_count) OR reserved_count < :max)'
+                ),
+                ExpressionAttributeValues={
+                    ':one': {'N': '1'},
+                    ':now': {'N': str(received_at)},
+                    ':max': {'N': str(max_emails)}
+                },
+                ReturnValues='UPDATED_NEW'
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            return None
+        return int(response['Attributes']['reserved_count']['N'])
+
+    def release_email_slot(self, inbox_id: str) -> None:
+        self.dynamodb.update_item(
+            TableName=self.inboxes_table,
+            Key={'id': {'S': inbox_id}},
+            UpdateExpression='ADD reserved_count :minus_one',
+            ConditionExpression='reserved_count > :zero',
+            ExpressionAttributeValues={
+                ':minus_one': {'N': '-1'},
+                ':zero': {'N': '0'}
+            }
+        )
+
+    def record_email_delivered(self, inbox_id: str, received_at: int) -> int:
+        response = self.dynamodb.update_item(
+            TableName=self.inboxes_table,
+            Key={'id': {'S': inbox_id}},
+            UpdateExpression='ADD email_count :one SET last_received_at = :received_at',
+            ConditionExpression='attribute_exists(id)',
+            ExpressionAttributeValues={
+                ':one': {'N': '1'},
+                ':received_at': {'N': str(received_at)}
+            },
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['email_count']['N'])
+
+    def get_email(self, inbox_id: str, email_id: str) -> Optional[EmailRecord]:
+        response = self.dynamodb.get_item(
+            TableName=self.emails_table,
+            Key={
+                'inbox_id': {'S': inbox_id},
+                'email_id': {'S': email_id}
+            }
+        )
+        if 'Item' not in response:
+            return None
+        return EmailRecord(response['Item'])
+
+    def get_emails(self, inbox_id: str, email_ids: Iterable[str]) -> Dict[str, EmailRecord]:
+        keys = [
+            {'inbox_id': {'S': inbox_id}, 'email_id': {'S': email_id}}
+            for email_id in dict.fromkeys(email_ids)
+        ]
+        items = self._batch_get(self.emails_table, keys)
+        return {item['email_id']['S']: EmailRecord(item) for item in items}
+
+    def put_email(self, email: Email) -> None:
+        self.dynamodb.put_item(
+            TableName=self.emails_table,
+            Item=email.to_dynamodb_item()
+        )
+
+    def put_emails(self, emails: List[Email]) -> List[str]:
+        requests = [{'PutRequest': {'Item': email.to_dynamodb_item()}} for email in emails]
+        unprocessed = self._batch_write(self.emails_table, requests)
+        return [request['PutRequest']['Item']['email_id']['S'] for request in unprocessed]
+
+    def get_email_summary(self, inbox_id: str, email_id: str) -> Optional[EmailSummary]:
+        response = self.dynamodb.get_item(
+            TableName=self.emails_table,
+            Key={
+                'inbox_id': {'S': inbox_id},
+                'email_id': {'S': email_id}
+            },
+            ProjectionExpression=EmailListItem.PROJECTION_EXPRESSION,
+            ExpressionAttributeNames=EmailListItem.PROJECTION_NAMES
+        )
+        if 'Item' not in response:
+            return None
+        return EmailSummary(response['Item'])
+
+    def query_email_summaries(self, inbox_id: str, limit: int, last_key: Optional[str] = None,
+                              after_key: Optional[str] = None,
+                              min_received_at: Optional[int] = None
+                              ) -> Tuple[List[EmailSummary], Optional[str]]:
+        query_params = {
+            'TableName': self.emails_table,
+            'KeyConditionExpression': 'inbox_id = :inbox_id',
+            'ExpressionAttributeValues': {':inbox_id': {'S': inbox_id}},
+            'ProjectionExpression': EmailListItem.PROJECTION_EXPRESSION,
+            'ExpressionAttributeNames': EmailListItem.PROJECTION_NAMES,
+            'Limit': limit,
+            'ScanIndexForward': False  # Time-ordered IDs: newest first
+        }
+        if after_key:
+            query_params['KeyConditionExpression'] += ' AND email_id > :after_key'
+            query_params['ExpressionAttributeValues'][':after_key'] = {'S': after_key}
+        if last_key:
+            query_params['ExclusiveStartKey'] = {
+                'inbox_id': {'S': inbox_id},
+                'email_id': {'S': last_key}
+            }
+        if min_received_at is not None:
+            query_params['FilterExpression'] = 'received_at >= :min_received_at'
+            query_params['ExpressionAttributeValues'][':min_received_at'] = {'N': str(min_received_at)}
+
+        response = self.dynamodb.query(**query_params)
+
+        emails = [EmailSummary(item) for item in response.get('Items', [])]
+        next_key = None
+        if 'LastEvaluatedKey' in response:
+            next_key = response['LastEvaluatedKey']['email_id']['S']
+        return emails, next_key
+
+    def get_blob(self, key: str, bucket: Optional[str] = None) -> bytes:
+        response = self.s3.get_object(Bucket=bucket or self.bucket, Key=key)
+        return response['Body'].read()
+
+    def open_blob(self, key: str, bucket: Optional[str] = None):
+        response = self.s3.get_object(Bucket=bucket or self.bucket, Key=key)
+        return response['Body']
+
+    def put_blob(self, key: str, data: bytes, content_type: str,
+                 metadata: Optional[dict] = None) -> None:
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type,
+            Metadata=metadata or {}
+        )
+
+    def put_blob_stream(self, key: str, chunks: Iterator[bytes], content_type: str,
+                        metadata: Optional[dict] = None) -> int:
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= MULTIPART_PART_SIZE:
+                    if upload_id is None:
+                        upload_id = self.s3.create_multipart_upload(
+                            Bucket=self.bucket,
+                            Key=key,
+                            ContentType=content_type,
+                            Metadata=metadata or {}
+                        )['UploadId']
+                    self._upload_part(key, upload_id, parts, bytes(buffer[:MULTIPART_PART_SIZE]))
+                    del buffer[:MULTIPART_PART_SIZE]
+
+            # Small blob: a single PUT
+            if upload_id is None:
+                self.put_blob(key, bytes(buffer), content_type, metadata)
+                return size
+
+            if buffer:
+                self._upload_part(key, upload_id, parts, bytes(buffer))
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except Exception:
+            if upload_id is not None:
+                self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+        return size
+
+    def _upload_part(self, key: str, upload_id: str, parts: List[dict], data: bytes) -> None:
+        part_number = len(parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def blob_download_url(self, key: str, filename: str, expires_in: int = 3600,
+                          content_type: Optional[str] = None) -> str:
+        params = {
+            'Bucket': self.bucket,
+            'Key': key,
+            'ResponseContentDisposition': f'attachment; filename="{filename}"'
+        }
+        if content_type:
+            params['ResponseContentType'] = content_type
+        return self.s3.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+    def reference_attachment_blob(self, digest: str, expires_at: int, fresh_after: int) -> bool:
+        try:
+            # Usually the newest reference also expires last
+            response = self.dynamodb.update_item(
+                TableName=self.attachments_table,
+                Key={'sha256': {'S': digest}},
+                UpdateExpression='SET expires_at = :expires_at',
+                ConditionExpression='attribute_not_exists(expires_at) OR expires_at < :expires_at',
+                ExpressionAttributeValues={':expires_at': {'N': str(expires_at)}},
+                ReturnValues='ALL_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+            record = response['Attributes']
+        except self.dynamodb.exceptions.ConditionalCheckFailedException as e:
+            # Already kept long enough; nothing to write
+            record = e.response.get('Item', {})
+        uploaded_at = record.get('uploaded_at')
+        return uploaded_at is not None and int(uploaded_at['N']) > fresh_after
+
+    def mark_attachment_blob_uploaded(self, digest: str, uploaded_at: int) -> None:
+        self.dynamodb.update_item(
+            TableName=self.attachments_table,
+            Key={'sha256': {'S': digest}},
+            UpdateExpression='SET uploaded_at = :uploaded_at',
+            ExpressionAttributeValues={':uploaded_at': {'N': str(uploaded_at)}}
+        )
+
+    def _batch_get(self, table: str, keys: List[dict], **options) -> List[dict]:
+        """BatchGetItem in chunks, retrying unprocessed keys"""
+        items = []
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            request = {table: {'Keys': keys[start:start + BATCH_GET_SIZE], **options}}
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                items.extend(response.get('Responses', {}).get(table, []))
+                request = response.get('UnprocessedKeys') or {}
+                if not request:
+                    break
+                time.sleep(BATCH_BACKOFF_SECONDS * 2 ** attempt)
+            else:
+                raise RuntimeError(f"BatchGetItem on {table} left keys unprocessed")
+        return items
+
+    def _batch_write(self, table: str, requests: List[dict]) -> List[dict]:
+        """BatchWriteItem in chunks, retrying unprocessed items; returns leftovers"""
+        leftovers = []
+        for start in range(0, len(requests), BATCH_WRITE_SIZE):
+            pending = requests[start:start + BATCH_WRITE_SIZE]
+            for attempt in range(BATCH_MAX_ATTEMPTS):
+                try:
+                    response = self.dynamodb.batch_write_item(RequestItems={table: pending})
+                except self.dynamodb.exceptions.ClientError as e:
+                    print(f"Error writing batch to {table}: {e}")
+                    if e.response['Error']['Code'] == 'ValidationException':
+                        # One invalid item (e.g. over 400KB) rejects the whole
+                        # batch; write the chunk item by item so only it fails
+                        pending = self._put_each(table, pending)
+                    break
+                except Exception as e:
+                    print(f"Error writing batch to {table}: {e}")
+                    break
+                pending = response.get('UnprocessedItems', {}).get(table, [])
+                if not pending:
+                    break
+                time.sleep(BATCH_BACKOFF_SECONDS * 2 ** attempt)
+            leftovers.extend(pending)
+        return leftovers
+
+    def _put_each(self, table: str, requests: List[dict]) -> List[dict]:
+        """PutItem each of a batch's put requests; returns the ones that failed"""
+        failed = []
+        for request in requests:
+            try:
+                self.dynamodb.put_item(TableName=table, Item=request['PutRequest']['Item'])
+            except Exception as e:
+                print(f"Error writing item to {table}: {e}")
+                failed.append(request)
+        return failed
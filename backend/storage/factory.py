@@ -0,0 +1,66 @@
+"""
+Storage backend selection from environment configuration
+"""
+import os
+
+from storage.base import StorageBackend
+
+# Configuration
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'dynamodb')
+INBOXES_TABLE = os.getenv('DYNAMODB_INBOXES_TABLE', 'easytempinbox-inboxes')
+EMAILS_TABLE = os.getenv('DYNAMODB_EMAILS_TABLE', 'easytempinbox-emails')
+ATTACHMENTS_TABLE = os.getenv('DYNAMODB_ATTACHMENTS_TABLE', 'easytempinbox-attachments')
+S3_BUCKET = os.getenv('S3_BUCKET_NAME', 'easytempinbox-raw-emails')
+
+_backend = None
+
+
+def create_aws_clients():
+    """Create boto3 DynamoDB and S3 clients"""
+    import boto3
+    from storage.aio import client_config
+
+    if os.getenv('LOCAL_TESTING') == 'true':
+        dynamodb = boto3.client(
+            'dynamodb',
+            region_name='us-east-1',
+            endpoint_url='http://localhost:8000',
+            aws_access_key_id='test',
+            aws_secret_access_key='test',
+            config=client_config()
+        )
+        s3 = boto3.client(
+            's3',
+            region_name='us-east-1',
+            aws_access_key_id='test',
+            aws_secret_access_key='test',
+            config=client_config()
+        )
+    else:
+        region = os.getenv('AWS_REGION', 'us-east-1')
+        dynamodb = boto3.client('dynamodb', region_name=region, config=client_config())
+        s3 = boto3.client('s3', region_name=region, config=client_config())
+    return dynamodb, s3
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Get the process-wide storage backend
+
+    STORAGE_BACKEND=dynamodb (default) uses DynamoDB + S3;
+    STORAGE_BACKEND=memory keeps everything in-process, so the API and the
+    parser can be benchmarked together on one machine without AWS.
+    """
+    global _backend
+    if _backend is None:
+        if STORAGE_BACKEND == 'memory':
+            from storage.memory import MemoryBackend
+            _backend = MemoryBackend(bucket=S3_BUCKET)
+        elif STORAGE_BACKEND == 'dynamodb':
+            from storage.dynamodb import DynamoDBBackend
+            dynamodb, s3 = create_aws_clients()
+            _backend = DynamoDBBackend(dynamodb, s3, INBOXES_TABLE, EMAILS_TABLE, S3_BUCKET,
+                                       attachments_table=ATTACHMENTS_TABLE)
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _backend
@@ -0,0 +1,196 @@
+"""
+In-process storage backend for local load testing and profiling
+
+Items are kept in the same DynamoDB wire format the real backend uses, so the
+model (de)serialization cost on the request and ingest paths is unchanged;
+only the network round trip is removed.
+"""
+import bisect
+import io
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.inbox import Inbox
+from models.email import Email, EmailRecord, EmailSummary
+from storage.base import StorageBackend
+
+# Attributes kept by the list projection (see EmailListItem.PROJECTION_EXPRESSION)
+SUMMARY_ATTRIBUTES = ('email_id', 'from', 'subject', 'received_at', 'has_html', 'attachment_count',
+                      'attachment_size', 'text_size', 'html_size', 'snippet', 'from_name')
+
+
+class MemoryBackend(StorageBackend):
+    """Thread-safe dict-backed storage"""
+
+    def __init__(self, bucket: str = 'memory'):
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._inboxes: Dict[str, dict] = {}
+        # inbox_id -> {email_id: item}, plus a sorted key list per inbox to
+        # mirror the emails table's sort key ordering
+        self._emails: Dict[str, Dict[str, dict]] = {}
+        self._email_keys: Dict[str, List[str]] = {}
+        self._blobs: Dict[Tuple[str, str], bytes] = {}
+        # sha256 -> {'expires_at', 'uploaded_at'}
+        self._attachment_refs: Dict[str, dict] = {}
+
+    def get_inbox(self, inbox_id: str) -> Optional[Inbox]:
+        with self._lock:
+            item = self._inboxes.get(inbox_id)
+            if item is None:
+                return None
+            return Inbox.from_dynamodb_item(item)
+
+    def get_inboxes(self, inbox_ids: Iterable[str]) -> Dict[str, Inbox]:
+        with self._lock:
+            return {
+                inbox_id: Inbox.from_dynamodb_item(self._inboxes[inbox_id])
+                for inbox_id in inbox_ids if inbox_id in self._inboxes
+            }
+
+    def scan_live_inboxes(self, now: int) -> Iterator[Tuple[str, int]]:
+        with self._lock:
+            rows = [
+                (inbox_id, int(item['expires_at']['N']))
+                for inbox_id, item in self._inboxes.items()
+            ]
+        return iter([(inbox_id, expires_at) for inbox_id, expires_at in rows if expires_at > now])
+
+    def put_inbox(self, inbox: Inbox) -> bool:
+        item = inbox.to_dynamodb_item()
+        with self._lock:
+            if inbox.id in self._inboxes:
+                return False
+            self._inboxes[inbox.id] = item
+        return True
+
+    def put_inboxes(self, inboxes: List[Inbox]) -> List[str]:
+        with self._lock:
+            for inbox in inboxes:
+                self._inboxes[inbox.id] = inbox.to_dynamodb_item()
+        return []
+
+    def reserve_email_slot(self, inbox_id: str, max_emails: int, received_at: int) -> Optional[int]:
+        with self._lock:
+            item = self._inboxes.get(inbox_id)
+            if item is None or int(item['expires_at']['N']) <= received_at:
+                return None
+            reserved_count = int(item.get('reserved_count', {}).get('N', '0'))
+            if reserved_count >= max_emails:
+                return None
+            item['reserved_count'] = {'N': str(reserved_count + 1)}
+            return reserved_count + 1
+
+    def release_email_slot(self, inbox_id: str) -> None:
+        with self._lock:
+            item = self._inboxes.get(inbox_id)
+            if item is not None:
+                reserved_count = int(item.get('reserved_count', {}).get('N', '0'))
+                item['reserved_count'] = {'N': str(max(0, reserved_count - 1))}
+
+    def record_email_delivered(self, inbox_id: str, received_at: int) -> int:
+        with self._lock:
+            item = self._inboxes[inbox_id]
+            email_count = int(item.get('email_count', {}).get('N', '0')) + 1
+            item['email_count'] = {'N': str(email_count)}
+            item['last_received_at'] = {'N': str(received_at)}
+            return email_count
+
+    def get_email(self, inbox_id: str, email_id: str) -> Optional[EmailRecord]:
+        with self._lock:
+            item = self._emails.get(inbox_id, {}).get(email_id)
+        if item is None:
+            return None
+        return EmailRecord(item)
+
+    def get_emails(self, inbox_id: str, email_ids: Iterable[str]) -> Dict[str, EmailRecord]:
+        with self._lock:
+            emails = self._emails.get(inbox_id, {})
+            items = [emails[email_id] for email_id in dict.fromkeys(email_ids) if email_id in emails]
+        return {item['email_id']['S']: EmailRecord(item) for item in items}
+
+    def put_email(self, email: Email) -> None:
+        item = email.to_dynamodb_item()
+        with self._lock:
+            emails = self._emails.setdefault(email.inbox_id, {})
+            if email.email_id not in emails:
+                bisect.insort(self._email_keys.setdefault(email.inbox_id, []), email.email_id)
+            emails[email.email_id] = item
+
+    def put_emails(self, emails: List[Email]) -> List[str]:
+        for email in emails:
+            self.put_email(email)
+        return []
+
+    def get_email_summary(self, inbox_id: str, email_id: str) -> Optional[EmailSummary]:
+        with self._lock:
+            item = self._emails.get(inbox_id, {}).get(email_id)
+        if item is None:
+            return None
+        return EmailSummary(_project_summary(item))
+
+    def query_email_summaries(self, inbox_id: str, limit: int, last_key: Optional[str] = None,
+                              after_key: Optional[str] = None,
+                              min_received_at: Optional[int] = None
+                              ) -> Tuple[List[EmailSummary], Optional[str]]:
+        with self._lock:
+            keys = self._email_keys.get(inbox_id, [])
+            # Descending order, starting strictly below last_key
+            end = bisect.bisect_left(keys, last_key) if last_key else len(keys)
+            start = bisect.bisect_right(keys, after_key) if after_key else 0
+            page = keys[max(start, end - limit):end][::-1]
+            items = [self._emails[inbox_id][k] for k in page]
+            has_more = end - limit > start
+        # Like a DynamoDB FilterExpression, the filter applies after the limit
+        emails = [
+            EmailSummary(_project_summary(item))
+            for item in items
+            if min_received_at is None or int(item['received_at']['N']) >= min_received_at
+        ]
+        next_key = page[-1] if page and has_more else None
+        return emails, next_key
+
+    def get_blob(self, key: str, bucket: Optional[str] = None) -> bytes:
+        with self._lock:
+            try:
+                return self._blobs[(bucket or self.bucket, key)]
+            except KeyError:
+                raise KeyError(f"No such blob: {bucket or self.bucket}/{key}")
+
+    def open_blob(self, key: str, bucket: Optional[str] = None):
+        return io.BytesIO(self.get_blob(key, bucket=bucket))
+
+    def put_blob(self, key: str, data: bytes, content_type: str,
+                 metadata: Optional[dict] = None) -> None:
+        with self._lock:
+            self._blobs[(self.bucket, key)] = bytes(data)
+
+    def put_blob_stream(self, key: str, chunks: Iterator[bytes], content_type: str,
+                        metadata: Optional[dict] = None) -> int:
+        data = b''.join(chunks)
+        self.put_blob(key, data, content_type, metadata)
+        return len(data)
+
+    def load_blob(self, bucket: str, key: str, data: bytes) -> None:
+        """Seed a blob in another bucket (e.g. raw emails for the parser)"""
+        with self._lock:
+            self._blobs[(bucket, key)] = bytes(data)
+
+    def blob_download_url(self, key: str, filename: str, expires_in: int = 3600,
+                          content_type: Optional[str] = None) -> str:
+        return f"memory://{self.bucket}/{key}"
+
+    def reference_attachment_blob(self, digest: str, expires_at: int, fresh_after: int) -> bool:
+        with self._lock:
+            record = self._attachment_refs.setdefault(digest, {'expires_at': 0})
+            record['expires_at'] = max(record['expires_at'], expires_at)
+            return record.get('uploaded_at', fresh_after) > fresh_after
+
+    def mark_attachment_blob_uploaded(self, digest: str, uploaded_at: int) -> None:
+        with self._lock:
+            self._attachment_refs.setdefault(digest, {'expires_at': 0})['uploaded_at'] = uploaded_at
+
+
+def _project_summary(item: dict) -> dict:
+    """Apply the list projection to a stored item"""
+    return {name: item[name] for name in SUMMARY_ATTRIBUTES if name in item}
@@ -0,0 +1,159 @@
+"""
+In-process notification hub for new-mail long polling
+"""
+import asyncio
+import os
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Configuration
+NOTIFY_TRANSPORT = os.getenv('NOTIFY_TRANSPORT', 'poll')
+NOTIFY_POLL_INTERVAL = float(os.getenv('NOTIFY_POLL_INTERVAL_SECONDS', '2'))
+
+_hub = None
+
+
+class LocalTransport:
+    """
+    Deliveries are published in-process
+
+    Used when the ingest path runs in the same process as the API (tests,
+    single-box load runs with STORAGE_BACKEND=memory): the parser's
+    publish() call wakes waiters directly, so there is nothing to watch.
+    """
+
+    def watch(self, hub: 'NotificationHub', inbox_id: str) -> None:
+        pass
+
+    def unwatch(self, inbox_id: str) -> None:
+        pass
+
+
+class StoragePollTransport:
+    """
+    Watch inbox counters in storage
+
+    The parser runs in a separate Lambda, so its publish() never reaches the
+    API process. Instead one background task per watched inbox re-reads the
+    inbox record's email_count (an O(1) item read) every `interval` seconds
+    and publishes changes; every waiter on that inbox shares the one poller.
+    The parser bumps email_count only after the email's row is written, so a
+    woken client always finds the new email.
+    """
+
+    def __init__(self, storage, interval: float = NOTIFY_POLL_INTERVAL):
+        # storage: an awaitable backend (storage.aio.AsyncClient)
+        self.storage = storage
+        self.interval = interval
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def watch(self, hub: 'NotificationHub', inbox_id: str) -> None:
+        if inbox_id not in self._tasks:
+            self._tasks[inbox_id] = asyncio.get_running_loop().create_task(
+                self._poll(hub, inbox_id)
+            )
+
+    def unwatch(self, inbox_id: str) -> None:
+        task = self._tasks.pop(inbox_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _poll(self, hub: 'NotificationHub', inbox_id: str) -> None:
+        while True:
+            try:
+                inbox = await self.storage.get_inbox(inbox_id)
+                if inbox is not None:
+                    hub.publish(inbox_id, inbox.email_count)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error polling inbox {inbox_id}: {e}")
+            await asyncio.sleep(self.interval)
+
+
+class NotificationHub:
+    """
+    Wakes long-poll requests when an inbox's email_count moves past a cursor
+
+    publish() is thread-safe and may be called from any thread (e.g. the
+    parser running on a worker thread); waiters are resolved on their own
+    event loop.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or LocalTransport()
+        self._lock = threading.Lock()
+        # inbox_id -> [(loop, future, since)]
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Future, int]]] = {}
+
+    def publish(self, inbox_id: str, email_count: int) -> None:
+        """Announce that inbox_id now holds email_count emails"""
+        with self._lock:
+            waiters = self._waiters.get(inbox_id)
+            if not waiters:
+                return
+            ready = [w for w in waiters if w[2] < email_count]
+        for loop, future, _ in ready:
+            loop.call_soon_threadsafe(_resolve, future, email_count)
+
+    async def wait(self, inbox_id: str, since: int, timeout: float,
+                   probe: Optional[Callable[[], Awaitable[int]]] = None) -> Optional[int]:
+        """
+        Wait until inbox_id's email_count exceeds `since`
+
+        probe, if given, returns the current email_count and is awaited after
+        subscribing, so a delivery that lands between the caller's last read
+        and the subscription is not missed. Returns the new count, or None on
+        timeout.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future, since)
+        with self._lock:
+            waiters = self._waiters.setdefault(inbox_id, [])
+            waiters.append(waiter)
+            first = len(waiters) == 1
+        if first:
+            self.transport.watch(self, inbox_id)
+        try:
+            if probe is not None:
+                current = await probe()
+                if current > since:
+                    return current
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(inbox_id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                last = not waiters
+                if last:
+                    self._waiters.pop(inbox_id, None)
+            if last:
+                self.transport.unwatch(inbox_id)
+
+
+def _resolve(future: asyncio.Future, email_count: int) -> None:
+    if not future.done():
+        future.set_result(email_count)
+
+
+def get_notification_hub(storage=None) -> NotificationHub:
+    """
+    Get the process-wide notification hub
+
+    NOTIFY_TRANSPORT=poll (default) watches inbox counters through `storage`
+    (an awaitable backend, required on first call); NOTIFY_TRANSPORT=local
+    relies on in-process publish() calls from the parser.
+    """
+    global _hub
+    if _hub is None:
+        if NOTIFY_TRANSPORT == 'poll' and storage is not None:
+            _hub = NotificationHub(StoragePollTransport(storage))
+        elif NOTIFY_TRANSPORT in ('poll', 'local'):
+            _hub = NotificationHub(LocalTransport())
+        else:
+            raise ValueError(f"Unknown NOTIFY_TRANSPORT: {NOTIFY_TRANSPORT}")
+    return _hub
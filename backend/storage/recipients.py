@@ -0,0 +1,125 @@
+"""
+Compact membership structure of live inbox IDs for early mail rejection
+"""
+import bisect
+import os
+import threading
+import time
+from array import array
+from typing import Callable, Iterable, Optional, Tuple
+
+from models.inbox import Inbox
+
+# Configuration
+RECIPIENT_FILTER_ENABLED = os.getenv('RECIPIENT_FILTER_ENABLED', 'true') == 'true'
+RECIPIENT_FILTER_REFRESH = int(os.getenv('RECIPIENT_FILTER_REFRESH_SECONDS', '300'))
+
+
+class RecipientFilter:
+    """
+    Sorted-array snapshot of live inboxes
+
+    Inbox IDs are 8 base-36 characters, so each one packs into a 64-bit
+    integer; the snapshot is two parallel arrays (ID, expires_at) sorted by
+    ID, about 16 bytes per live inbox, searched with bisect.
+
+    check() answers from the snapshot alone:
+    - False: the address cannot be a live inbox (malformed ID, or an inbox
+      in the snapshot that has since expired)
+    - True: a live inbox per the snapshot (expires_at never changes)
+    - None: not in the snapshot; the inbox may have been created after the
+      last refresh, so the caller must look it up
+
+    `loader` returns (inbox_id, expires_at) pairs for live inboxes, e.g.
+    StorageBackend.scan_live_inboxes or a local stand-in. A full Scan
+    (which also reads TTL-expired rows not yet deleted) takes a while on a
+    large table, so maybe_refresh() runs it on a background thread.
+    """
+
+    def __init__(self, loader: Callable[[int], Iterable[Tuple[str, int]]],
+                 refresh_interval: int = RECIPIENT_FILTER_REFRESH):
+        self.loader = loader
+        self.refresh_interval = refresh_interval
+        self.loaded_at = 0.0
+        # When the last refresh started, and whether one is running
+        self._attempted_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._ids = array('q')
+        self._expires = array('q')
+
+    @staticmethod
+    def _pack(inbox_id: str) -> Optional[int]:
+        if not Inbox.is_valid_id(inbox_id):
+            return None
+        return int(inbox_id, 36)
+
+    def refresh(self) -> None:
+        """Reload the snapshot from the loader"""
+        now = time.time()
+        rows = sorted(
+            (packed, expires_at)
+            for packed, expires_at in (
+                (self._pack(inbox_id), expires_at)
+                for inbox_id, expires_at in self.loader(int(now))
+            )
+            if packed is not None
+        )
+        ids = array('q', (packed for packed, _ in rows))
+        expires = array('q', (expires_at for _, expires_at in rows))
+        with self._lock:
+            self._ids, self._expires = ids, expires
+            self.loaded_at = now
+        print(f"Recipient filter loaded {len(ids)} live inboxes")
+
+    def maybe_refresh(self) -> None:
+        """
+        Start a background reload if the last one is older than the interval
+
+        Never blocks: until the reload finishes, check() answers from the
+        previous snapshot (empty on a cold start) and leaves anything not
+        in it to the caller's lookup. A failed reload is retried one
+        interval later.
+        """
+        now = time.time()
+        with self._lock:
+            if self._refreshing or now - self._attempted_at < self.refresh_interval:
+                return
+            self._refreshing = True
+            self._attempted_at = now
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Error refreshing recipient filter: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def add(self, inbox_id: str, expires_at: int) -> None:
+        """Insert an inbox found by a lookup after the last refresh"""
+        packed = self._pack(inbox_id)
+        if packed is None:
+            return
+        with self._lock:
+            index = bisect.bisect_left(self._ids, packed)
+            if index < len(self._ids) and self._ids[index] == packed:
+                return
+            self._ids.insert(index, packed)
+            self._expires.insert(index, expires_at)
+
+    def check(self, inbox_id: str) -> Optional[bool]:
+        """See class docstring"""
+        packed = self._pack(inbox_id)
+        if packed is None:
+            return False
+        with self._lock:
+            index = bisect.bisect_left(self._ids, packed)
+            if index < len(self._ids) and self._ids[index] == packed:
+                return time.time() < self._expires[index]
+        return None
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -25,7 +25,7 @@ function Deploy-EmailParser {
     
     # Clean old packages
     Write-Host "  - Cleaning old packages..."
-    Get-ChildItem -Exclude email_parser.py,models,email_parser.zip -ErrorAction SilentlyContinue | Remove-Item -Recurse -Force -ErrorAction SilentlyContinue
+    Get-ChildItem -Exclude email_parser.py,models,storage,email_parser.zip -ErrorAction SilentlyContinue | Remove-Item -Recurse -Force -ErrorAction SilentlyContinue
     
     # Install dependencies for Linux
     Write-Host "  - Installing Linux dependencies..."
@@ -36,6 +36,11 @@ function Deploy-EmailParser {
     Remove-Item models -Recurse -Force -ErrorAction SilentlyContinue
     Copy-Item -Path ..\models -Destination . -Recurse
     
+    # Copy storage layer
+    Write-Host "  - Copying storage..."
+    Remove-Item storage -Recurse -Force -ErrorAction SilentlyContinue
+    Copy-Item -Path ..\storage -Destination . -Recurse
+    
     # Create zip
     Write-Host "  - Creating deployment package..."
     Remove-Item email_parser.zip -Force -ErrorAction SilentlyContinue
@@ -57,7 +62,7 @@ function Deploy-Api {
     
     # Clean old packages
     Write-Host "  - Cleaning old packages..."
-    Get-ChildItem -Exclude main.py,models,api.zip -ErrorAction SilentlyContinue | Remove-Item -Recurse -Force -ErrorAction SilentlyContinue
+    Get-ChildItem -Exclude main.py,rate_limiter.py,models,storage,api.zip -ErrorAction SilentlyContinue | Remove-Item -Recurse -Force -ErrorAction SilentlyContinue
     
     # Install dependencies for Linux
     Write-Host "  - Installing Linux dependencies..."
@@ -68,6 +73,11 @@ function Deploy-Api {
     Remove-Item models -Recurse -Force -ErrorAction SilentlyContinue
     Copy-Item -Path ..\models -Destination . -Recurse
     
+    # Copy storage layer
+    Write-Host "  - Copying storage..."
+    Remove-Item storage -Recurse -Force -ErrorAction SilentlyContinue
+    Copy-Item -Path ..\storage -Destination . -Recurse
+    
     # Create zip
     Write-Host "  - Creating deployment package..."
     Remove-Item api.zip -Force -ErrorAction SilentlyContinue
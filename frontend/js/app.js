@@ -7,14 +7,20 @@
 //const API_BASE_URL = 'https://your-api-gateway-url.amazonaws.com'; // Replace with actual API Gateway URL
 //const API_BASE_URL = 'http://localhost:8001';  // Local testing
 const API_BASE_URL = 'https://eagu6a93n6.execute-api.us-east-1.amazonaws.com';  // Production
+// Long polling needs the API on a long-running server with LONG_POLL_ENABLED;
+// otherwise the inbox status is polled with backoff
+const LONG_POLL_ENABLED = false;
+const LONG_POLL_TIMEOUT = 25; // Seconds the server holds each wait request
+const LONG_POLL_RETRY_DELAY = 5000; // Pause after a failed wait request
 const POLLING_INTERVAL_START = 5000; // Start at 5 seconds
 const POLLING_INTERVAL_MAX = 30000; // Max 30 seconds
 const POLLING_BACKOFF_MULTIPLIER = 1.5;
 
 // State
 let currentInbox = null;
-let pollingInterval = null;
-let pollingIntervalMs = POLLING_INTERVAL_START;
+let pollingSession = 0; // Incremented to cancel the running polling loop
+let knownEmailCount = 0; // email_count from the last status response
+let currentEmails = []; // Emails shown in the list, newest first
 let countdownInterval = null;
 let lastRefreshTime = null;
 
@@ -71,7 +77,9 @@ async function apiRequest(endpoint, options = {}) {
 
         if (!response.ok) {
             const error = await response.json();
-            throw new Error(error.detail || 'API request failed');
+            // detail is a string, or an object with a message (e.g. 429s)
+            const detail = error.detail && (typeof error.detail === 'string' ? error.detail : error.detail.message);
+            throw new Error(detail || 'API request failed');
         }
 
         return await response.json();
@@ -122,19 +130,53 @@ async function fetchEmails() {
     if (!currentInbox) return;
 
     try {
+        // The list carries an ETag, so an unchanged inbox is revalidated by
+        // the browser cache with a 304 instead of being downloaded again
         const data = await apiRequest(`/api/inbox/${currentInbox.id}/emails`);
+        currentEmails = data.emails;
 
         // Update email count
         emailCount.textContent = data.count;
 
         // Render email list
-        renderEmailList(data.emails);
+        renderEmailList(currentEmails);
 
     } catch (error) {
         console.error('Failed to fetch emails:', error);
     }
 }
 
+async function fetchNewEmails() {
+    if (!currentInbox) return;
+    if (currentEmails.length === 0) return fetchEmails();
+
+    try {
+        // Only download emails newer than the newest one already shown (the
+        // server also returns recent older ones, which may have been written
+        // after it)
+        const since = encodeURIComponent(currentEmails[0].email_id);
+        const data = await apiRequest(`/api/inbox/${currentInbox.id}/emails?since=${since}&limit=100`);
+
+        // More new emails than one page holds: reload the list instead
+        if (data.last_key) return fetchEmails();
+
+        const known = new Set(currentEmails.map(email => email.email_id));
+        const added = data.emails.filter(email => !known.has(email.email_id));
+        currentEmails = [...added, ...currentEmails];
+        // Email IDs sort by receipt time; keep the list newest first
+        currentEmails.sort((a, b) => (a.email_id < b.email_id ? 1 : a.email_id > b.email_id ? -1 : 0));
+
+        // Update email count
+        emailCount.textContent = currentEmails.length;
+
+        // Render email list
+        renderEmailList(currentEmails);
+
+    } catch (error) {
+        console.error('Failed to fetch new emails:', error);
+    }
+}
+
 async function fetchEmailDetail(inboxId, emailId) {
     try {
         const data = await apiRequest(`/api/email/${inboxId}/${emailId}`);
@@ -164,11 +206,22 @@ async function downloadAttachment(attachmentId) {
     }
 }
 
-async function getInboxStatus() {
-    if (!currentInbox) return;
+async function waitForInboxChange(session) {
+    if (!currentInbox) return true;
+
+    // Get current count BEFORE waiting
+    const currentCount = knownEmailCount;
 
     try {
-        const data = await apiRequest(`/api/inbox/${currentInbox.id}/status`);
+        // With long polling, held open by the server until new mail arrives
+        // or the wait times out
+        const data = await apiRequest(LONG_POLL_ENABLED
+            ? `/api/inbox/${currentInbox.id}/wait?since=${currentCount}&timeout=${LONG_POLL_TIMEOUT}`
+            : `/api/inbox/${currentInbox.id}/status`
+        );
+
+        // Ignore responses for a stopped loop or a replaced inbox
+        if (session !== pollingSession) return true;
 
         if (!data.exists) {
             // Inbox expired
@@ -176,16 +229,15 @@ async function getInboxStatus() {
             stopCountdown();
             alert('Your inbox has expired');
             resetUI();
-            return;
+            return true;
         }
 
-        // Get current count BEFORE updating
-        const currentCount = parseInt(emailCount.textContent) || 0;
+        knownEmailCount = data.email_count;
 
         // If count changed, fetch emails to update the list
         if (data.email_count !== currentCount) {
-            await fetchEmails();
-            // Email count will be updated by fetchEmails()
+            await fetchNewEmails();
+            // Email count will be updated by fetchNewEmails()
 
             // Show notification for new emails (only if count increased)
             if (data.email_count > currentCount) {
@@ -198,9 +250,11 @@ async function getInboxStatus() {
 
         // Update refresh status
         updateRefreshStatus();
+        return true;
 
     } catch (error) {
         console.error('Failed to get inbox status:', error);
+        return false;
     }
 }
 
@@ -251,10 +305,11 @@ function renderEmailList(emails) {
     emailList.innerHTML = emails.map(email => `
         <div class="email-item" onclick="viewEmail('${email.email_id}')">
             <div class="email-item-header">
-                <span class="email-from">${escapeHtml(email.from_address)}</span>
+                <span class="email-from">${escapeHtml(email.from_name || email.from_address)}</span>
                 <span class="email-time">${formatTime(email.received_at)}</span>
             </div>
-            <div class="email-subject">${escapeHtml(email.subject)}</div>
+            <div class="email-subject">${email.attachment_count ? '📎 ' : ''}${escapeHtml(email.subject)}</div>
+            ${email.snippet ? `<div class="email-snippet">${escapeHtml(email.snippet)}</div>` : ''}
         </div>
     `).join('');
 }
@@ -327,30 +382,31 @@ function showInboxView() {
     inboxSection.style.display = 'block';
 }
 
-// Polling
-function startPolling() {
-    stopPolling(); // Clear any existing interval
-
-    pollingInterval = setInterval(() => {
-        getInboxStatus();
-
-        // Exponential backoff
-        pollingIntervalMs = Math.min(
-            pollingIntervalMs * POLLING_BACKOFF_MULTIPLIER,
-            POLLING_INTERVAL_MAX
-        );
-
-        // Restart with new interval
-        startPolling();
-
-    }, pollingIntervalMs);
+// Polling (long-poll: one request per wait period, answered as soon as mail
+// arrives; otherwise status requests with exponential backoff)
+async function startPolling() {
+    stopPolling(); // Cancel any existing loop
+
+    const session = pollingSession;
+    let pollingIntervalMs = POLLING_INTERVAL_START;
+    while (currentInbox && session === pollingSession) {
+        if (!LONG_POLL_ENABLED) {
+            await new Promise(resolve => setTimeout(resolve, pollingIntervalMs));
+            if (session !== pollingSession) break;
+            pollingIntervalMs = Math.min(
+                pollingIntervalMs * POLLING_BACKOFF_MULTIPLIER,
+                POLLING_INTERVAL_MAX
+            );
+        }
+        const ok = await waitForInboxChange(session);
+        if (!ok && LONG_POLL_ENABLED) {
+            await new Promise(resolve => setTimeout(resolve, LONG_POLL_RETRY_DELAY));
+        }
+    }
 }
 
 function stopPolling() {
-    if (pollingInterval) {
-        clearInterval(pollingInterval);
-        pollingInterval = null;
-    }
+    pollingSession++;
 }
 
 // Countdown Timer
@@ -424,7 +480,6 @@ function hideQRCode() {
 }
 
 function refreshInbox() {
-    pollingIntervalMs = POLLING_INTERVAL_START; // Reset backoff
     fetchEmails();
 }
 
@@ -441,7 +496,9 @@ function resetUI() {
     emailAddress.value = '';
     emailCount.textContent = '0';
     countdown.textContent = '--:--:--';
-    pollingIntervalMs = POLLING_INTERVAL_START;
+    knownEmailCount = 0;
+    currentEmails = [];
+    stopPolling();
 }
 
 function escapeHtml(text) {